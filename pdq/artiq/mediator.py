@@ -1,3 +1,5 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from artiq.language import us, ns, delay_mu, at_mu, kernel, portable, s
 
 
@@ -31,6 +33,21 @@ class ArmError(Exception):
     pass
 
 
+class ProgramError(Exception):
+    """Raised when programming one or more PDQ devices during arming
+    failed.
+
+    Attributes:
+        errors (dict[int, Exception]): Exception raised for each failed
+            device, by device index.
+    """
+    def __init__(self, errors):
+        Exception.__init__(self, "programming failed on device(s) {}: {}"
+                           .format(sorted(errors), "; ".join(
+                               repr(errors[i]) for i in sorted(errors))))
+        self.errors = errors
+
+
 class _Segment:
     def __init__(self, frame, segment_number):
         self.frame = frame
@@ -153,14 +170,31 @@ class _Frame:
 
 
 class CompoundPDQ:
+    """Several PDQ devices driven as one.
+
+    The program is sliced by channel and each device is programmed
+    concurrently from a thread pool when arming (see :meth:`arm`).
+
+    Args:
+        dmgr: Device manager.
+        pdq_devices (list[str]): PDQ device names. Their channels are
+            concatenated in this order.
+        trigger_device (str): TTL device name of the trigger.
+        aux_miso, aux_dac, clk2x: See :meth:`PDQBase.set_config`.
+        max_workers (int): Maximum number of devices programmed
+            concurrently. Defaults to all. Use ``1`` if the devices can not
+            be accessed concurrently (e.g. SPI devices sharing the core
+            device).
+    """
     def __init__(self, dmgr, pdq_devices, trigger_device,
-            aux_miso=0, aux_dac=0b111, clk2x=0):
+            aux_miso=0, aux_dac=0b111, clk2x=0, max_workers=None):
         self.core = dmgr.get("core")
         self.pdqs = [dmgr.get(d) for d in pdq_devices]
         self.trigger = dmgr.get(trigger_device)
         self.aux_miso = aux_miso
         self.aux_dac = aux_dac
         self.clk2x = clk2x
+        self.max_workers = max_workers
 
         self.frames = []
         self.current_frame = -1
@@ -180,31 +214,56 @@ class CompoundPDQ:
     def get_program(self):
         return [f._get_program() for f in self.frames]
 
-    @portable
+    @staticmethod
+    def _slice_program(full_program, n, dn):
+        program = []
+        for full_frame_program in full_program:
+            frame_program = []
+            for full_line in full_frame_program:
+                line = {
+                    "dac_divider": full_line["dac_divider"],
+                    "duration": full_line["duration"],
+                    "channel_data": full_line["channel_data"][n:n + dn],
+                    "trigger": full_line["trigger"],
+                }
+                frame_program.append(line)
+            program.append(frame_program)
+        return program
+
+    def _map(self, executor, fn, *iterables):
+        futures = [executor.submit(fn, *args) for args in zip(*iterables)]
+        errors = {}
+        for i, future in enumerate(futures):
+            error = future.exception()
+            if error is not None:
+                errors[i] = error
+        if errors:
+            raise ProgramError(errors) from errors[min(errors)]
+        return [future.result() for future in futures]
+
     def arm(self):
+        """Program all devices and enable them.
+
+        The program is sliced and written to each device concurrently. The
+        devices are enabled afterwards, in order. If programming fails on
+        any device, none is enabled and :class:`ProgramError` is raised
+        once all devices have finished.
+        """
         if self.armed:
             raise ArmError()
         for frame in self.frames:
             frame._arm()
 
         full_program = self.get_program()
-        n = 0
-        for pdq in self.pdqs:
-            dn = pdq.get_num_channels()
-            program = []
-            for full_frame_program in full_program:
-                frame_program = []
-                for full_line in full_frame_program:
-                    line = {
-                        "dac_divider": full_line["dac_divider"],
-                        "duration": full_line["duration"],
-                        "channel_data": full_line["channel_data"][n:n + dn],
-                        "trigger": full_line["trigger"],
-                    }
-                    frame_program.append(line)
-                program.append(frame_program)
-            pdq.program(program)
-            n += dn
+        max_workers = self.max_workers or max(1, len(self.pdqs))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dns = self._map(executor, lambda pdq: pdq.get_num_channels(),
+                            self.pdqs)
+            offsets = [sum(dns[:i]) for i in range(len(dns))]
+
+            def program(pdq, n, dn):
+                pdq.program(self._slice_program(full_program, n, dn))
+            self._map(executor, program, self.pdqs, offsets, dns)
         for pdq in self.pdqs:
             pdq.set_config(reset=0, clk2x=self.clk2x, enable=1, trigger=0,
                     aux_miso=self.aux_miso, aux_dac=self.aux_dac, board=0xf)
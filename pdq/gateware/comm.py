@@ -69,34 +69,102 @@ class FTDI2SPI(Module):
     It uses the :class:`Unescaper` to to detect escaped start-of-frame SOF
     and EOF characters.
 
+    A frame can also be started with the escaped length-prefix character
+    (``0x04``) followed by the frame length in bytes (16 bit, little
+    endian). The frame data that follows is passed through without
+    unescaping and the frame ends after the given number of bytes without
+    an EOF.
+
+    A start of frame ends any active escaped frame. A length-prefixed frame
+    that receives no data for ``timeout`` cycles is aborted. This
+    resynchronizes the stream after a truncated frame.
+
+    Args:
+        timeout (int): Idle cycles after which a length-prefixed frame is
+            aborted. ``None`` disables the timeout.
+
     Attributes:
         sink (Endpoint): Raw data from FTDI parallel bus.
         source (Endpoint): Framed data stream (eop asserted when there is no
             active frame).
     """
-    def __init__(self):
+    def __init__(self, timeout=1 << 20):
         self.sink = Endpoint(bus_layout)
         self.source = Endpoint(bus_layout)
-        self.source.eop.reset = 1
 
         ###
 
         unesc = Unescaper(bus_layout)
         self.submodules += unesc
+
+        eop = Signal(reset=1)  # no active frame
+        header = Signal(2)  # length bytes to be received
+        remaining = Signal(16)  # unescaped frame bytes to be passed
+        length = Signal(16)
+        self.comb += length.eq(Cat(remaining[8:], self.sink.data))
+
         self.sync += [
-            If(unesc.source1.stb,
+            If(header != 0,
+                If(self.sink.stb,
+                    remaining.eq(length),
+                    header.eq(header - 1),
+                    If(header == 1,
+                        eop.eq(length == 0),
+                    ),
+                ),
+            ).Elif(remaining != 0,
+                If(self.sink.stb & self.source.ack,
+                    remaining.eq(remaining - 1),
+                    If(remaining == 1,
+                        eop.eq(1),
+                    ),
+                ),
+            ).Elif(unesc.source1.stb,
                 Case(unesc.source1.data, {
-                    0x02: self.source.eop.eq(0),
-                    0x03: self.source.eop.eq(1),
+                    0x02: eop.eq(0),
+                    0x03: eop.eq(1),
+                    0x04: [
+                        eop.eq(1),
+                        header.eq(2),
+                    ],
                 }),
             )
         ]
+        if timeout is not None:
+            idle = Signal()  # length-prefixed frame waiting for data
+            count = Signal(max=timeout + 1)
+            self.comb += idle.eq(((header != 0) | (remaining != 0)) &
+                                 ~self.sink.stb)
+            self.sync += [
+                If(idle,
+                    count.eq(count + 1),
+                ).Else(
+                    count.eq(0),
+                ),
+                If(count == timeout,
+                    count.eq(0),
+                    header.eq(0),
+                    remaining.eq(0),
+                    eop.eq(1),
+                ),
+            ]
         self.comb += [
-            self.sink.connect(unesc.sink),
-            self.source.data.eq(unesc.source0.data),
-            self.source.stb.eq(unesc.source0.stb),
-            unesc.source0.ack.eq(self.source.ack),
+            If(header != 0,
+                self.sink.ack.eq(1),
+            ).Elif(remaining != 0,
+                self.source.data.eq(self.sink.data),
+                self.source.stb.eq(self.sink.stb),
+                self.sink.ack.eq(self.source.ack),
+            ).Else(
+                self.sink.connect(unesc.sink),
+                self.source.data.eq(unesc.source0.data),
+                self.source.stb.eq(unesc.source0.stb),
+                unesc.source0.ack.eq(self.source.ack),
+            ),
             unesc.source1.ack.eq(1),
+            # a start of frame also ends a truncated frame
+            self.source.eop.eq(eop | (unesc.source1.stb &
+                                      (unesc.source1.data == 0x02))),
         ]
 
 
@@ -126,7 +194,8 @@ class Protocol(Module):
     reads/writes data in the channel memories.
 
     Args:
-        mems (list): List of memories from :mod:`gateware.dac.Dac`.
+        mems (list): List of 32 bit wide memories from
+            :mod:`gateware.dac.Dac`. Each byte is written individually.
 
     Attributes:
         sink (Endpoint): 8 bit data sink.
@@ -189,18 +258,18 @@ class Protocol(Module):
         mems = [mem.get_port(write_capable=True, we_granularity=8)
                 for mem in mems]
         self.specials += mems
-        mem_adr = Signal(16)
+        mem_adr = Signal(16)  # byte address
         mem_we = Signal()
-        mem_dat_r = Signal(16)
+        mem_dat_r = Signal(32)
         self.comb += [
             self.sink.ack.eq(1),
             [[
-                mem.adr.eq(mem_adr[1:]),
-                mem.dat_w.eq(Replicate(self.sink.data, 2)),
+                mem.adr.eq(mem_adr[2:]),
+                mem.dat_w.eq(Replicate(self.sink.data, 4)),
             ] for mem in mems],
             If(mem_we,
                 Array([mem.we for mem in mems])[cmd.adr].eq(
-                    Mux(mem_adr[0], 0b10, 0b01)),
+                    Cat([mem_adr[:2] == i for i in range(4)])),
             ),
             mem_dat_r.eq(Array([mem.dat_r for mem in mems])[cmd.adr]),
         ]
@@ -240,8 +309,9 @@ class Protocol(Module):
         fsm.act("MEM_DO",
             mem_we.eq(self.sink.stb & cmd.we),
             self.source.stb.eq(self.sink.stb & ~cmd.we),
-            self.source.data.eq(Mux(mem_adr[0],
-                                    mem_dat_r[8:], mem_dat_r[:8])),
+            self.source.data.eq(Array([mem_dat_r[i:i + 8]
+                                       for i in range(0, 32, 8)])[
+                                           mem_adr[:2]]),
         )
         self.sync += [
             If(fsm.before_leaving("CMD"),
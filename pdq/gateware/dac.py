@@ -46,97 +46,131 @@ class Parser(Module):
     Reads memory controlled by TTL signals, builds lines, and submits
     them to its output.
 
+    The memory is organized in 32 bit entries holding two consecutive 16 bit
+    words (the lower word at the even address). Two words of a line are read
+    per cycle. A line starting at an odd word address takes one more cycle.
+    The next line is read while the previous line is waiting to be
+    acknowledged and is submitted in the cycle after it was read completely.
+    A line of ``n`` words is thus submitted ``ceil(n/2)`` cycles after the
+    previous line has been acknowledged (one more if the line starts at an
+    odd address). After a line with the ``end`` bit, three more cycles are
+    needed to return through the frame address table.
+
     Args:
-        mem_depth (int): Memory depth in 16 bit entries.
+        mem_depth (int): Memory depth in 16 bit words.
 
     Attributes:
-        mem (Memory): Memory to read from.
+        mem (Memory): Memory to read from. 32 bit wide and ``mem_depth/2``
+            deep.
         source (Endpoint[line_layout]): Endpoint of lines read from memory. Output.
         arm (Signal): Allow triggers. If disarmed, the next line will not be
             read. Instead, the Parser will return to the frame address table.
             Input.
         start (Signal): Allow leaving the frame address table. Input.
+        ready (Signal): All submitted lines have been consumed. Leaving the
+            frame address table waits for it. Input.
         frame (Signal[3]): Values of the frame selection lines. Input.
     """
     def __init__(self, mem_depth=4*(1 << 10)):  # XC3S500E: 20x18bx1024
-        self.specials.mem = Memory(width=16, depth=mem_depth)
+        self.specials.mem = Memory(width=32, depth=mem_depth//2)
         self.specials.read = read = self.mem.get_port()
 
         self.source = Endpoint(line_layout)
         self.arm = Signal()
         self.start = Signal()
+        self.ready = Signal(reset=1)
         self.frame = Signal(max=32)
 
         ###
 
-        adr = Signal.like(read.adr)
-        inc = Signal()
+        adr = Signal(len(read.adr) + 1)  # word address
+        adr_next = Signal.like(adr)
+        odd = Signal()
+        lo = Signal(16)
+        hi = Signal(16)
+        word = Signal(16)
+        self.comb += [
+                lo.eq(read.dat_r[:16]),
+                hi.eq(read.dat_r[16:]),
+                word.eq(Mux(odd, hi, lo)),
+        ]
 
         lp = self.source.payload
         raw = Signal.like(lp.raw_bits())
         self.comb += lp.raw_bits().eq(raw)
-        lpa = Array([raw[i:i + len(read.dat_r)] for i in
-            range(0, len(raw), len(read.dat_r))])
-        data_read = Signal.like(lp.header.length)
+        lpa = Array([raw[i:i + 16] for i in range(0, len(raw), 16)])
+        data_read = Signal(max=len(lpa) + 1)  # words of the line read
+        length = Signal.like(lp.header.length)
+        two = Signal()  # read two words
+        take = Signal()  # read words of the line
+        done = Signal()  # the line is complete
+
+        self.comb += [
+                # the header is either in dat_r or already in raw
+                length.eq(Mux(data_read == 0, word[:4], lp.header.length)),
+                two.eq(~adr[0] & (data_read < length)),
+                adr_next.eq(adr + 1 + two),
+        ]
 
         self.submodules.fsm = fsm = ResetInserter()(FSM(reset_state="JUMP"))
         fsm.act("JUMP",
-                read.adr.eq(self.frame),
-                If(self.start,
+                read.adr.eq(self.frame[1:]),
+                If(self.start & self.ready,
                     NextState("FRAME")
                 )
         )
         fsm.act("FRAME",
-                read.adr.eq(read.dat_r),
-                inc.eq(1),
-                If(read.dat_r == 0,
+                read.adr.eq(word[1:]),
+                If(word == 0,
                     NextState("JUMP")
                 ).Else(
-                    NextState("HEADER")
+                    NextState("LINE")
                 )
         )
-        fsm.act("HEADER",
-                read.adr.eq(adr),
-                inc.eq(1),
-                NextState("LINE")
-        )
         fsm.act("LINE",
-                read.adr.eq(adr),
-                If(data_read == lp.header.length,
-                    NextState("STB")
-                ).Else(
-                    inc.eq(1),
+                read.adr.eq(adr[1:]),
+                If(done & self.source.ack & lp.header.end,
+                    NextState("JUMP")
+                ).Elif(~done | self.source.ack,
+                    take.eq(1),
+                    read.adr.eq(adr_next[1:]),
                 )
         )
-        fsm.act("STB",
-                read.adr.eq(adr),
-                self.source.stb.eq(1),
-                If(self.source.ack,
-                    inc.eq(1),
-                    If(lp.header.end,
-                        NextState("JUMP")
-                    ).Else(
-                        NextState("HEADER")
-                    )
-                ),
-        )
 
         self.comb += [
-                fsm.reset.eq(~self.arm)
+                fsm.reset.eq(~self.arm),
+                odd.eq(adr[0]),
+                self.source.stb.eq(done & fsm.ongoing("LINE")),
         ]
 
         self.sync += [
-                If(inc,
-                    adr.eq(read.adr + 1),
+                If(fsm.ongoing("JUMP"),
+                    adr.eq(self.frame),
+                    data_read.eq(0),
+                    done.eq(0),
                 ),
-                If(fsm.ongoing("HEADER"),
-                    raw.eq(read.dat_r),
-                    data_read.eq(1),
+                If(fsm.ongoing("FRAME"),
+                    adr.eq(word),
+                ),
+                If(self.source.ack,
+                    done.eq(0),
+                ),
+                If(take,
+                    adr.eq(adr_next),
+                    data_read.eq(data_read + 1 + two),
+                    If(data_read == 0,
+                        raw.eq(Mux(odd, hi, Cat(lo, hi))),
+                    ).Else(
+                        lpa[data_read].eq(word),
+                        If(two,
+                            lpa[data_read + 1].eq(hi),
+                        )
+                    ),
+                    If(data_read + 1 + two == length + 1,
+                        data_read.eq(0),
+                        done.eq(1),
+                    ),
                 ),
-                If(fsm.ongoing("LINE"),
-                    lpa[data_read].eq(read.dat_r),
-                    data_read.eq(data_read + 1),
-                )
         ]
 
 
@@ -326,7 +360,10 @@ class Dac(Module):
 
     Args:
         fifo (int): Number of lines to buffer between :class:`Parser` and
-            :class:`Sequencer`.
+            :class:`Sequencer`. The buffer allows the :class:`Parser` to
+            read ahead during long lines and sustain short lines. Lines
+            are buffered at most until the end of the frame. ``0``
+            connects them directly.
         **kwargs: Passed to :class:`Parser`.
 
     Attributes:
@@ -334,12 +371,17 @@ class Dac(Module):
         out: The :class:`Sequencer` and output executor. Connect its ``data``
             to the DAC.
     """
-    def __init__(self, fifo=0, **kwargs):
+    def __init__(self, fifo=4, **kwargs):
         self.submodules.parser = Parser(**kwargs)
         self.submodules.out = Sequencer()
         if fifo:
-            self.submodules.fifo = SyncFIFO(line_layout, fifo)
+            self.submodules.fifo = ResetInserter()(
+                SyncFIFO(line_layout, fifo))
             self.comb += [
+                    self.fifo.reset.eq(~self.parser.arm),
+                    # frame selection after the end of a frame only once
+                    # it has been played
+                    self.parser.ready.eq(~self.fifo.source.stb),
                     self.parser.source.connect(self.fifo.sink),
                     self.fifo.source.connect(self.out.sink),
             ]
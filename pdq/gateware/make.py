@@ -31,6 +31,9 @@ def main():
             "configurations. Default is to build all three configuations. "
             "Waveform memory is distributed among the channels.",
             default=[], type=int, action="append")
+    parser.add_argument("-f", "--fifo", default=4, type=int,
+            help="Line FIFO depth of each DAC channel (0 to disable). "
+            "Default is %(default)s.")
     args = parser.parse_args()
 
     if not args.config:
@@ -38,7 +41,8 @@ def main():
     for config in args.config:
         mems = [None, (20,), (10, 10), (8, 6, 6)][config]
         platform = Platform()
-        pdq = Pdq(platform, mem_depths=[i << 10 for i in mems])
+        pdq = Pdq(platform, mem_depths=[i << 10 for i in mems],
+                  fifo=args.fifo)
         platform.build(pdq, build_name="pdq_{}ch".format(config),
                        toolchain_path=args.xilinx)
 
@@ -35,15 +35,18 @@ class PdqBase(Module):
     Args:
         ctrl_pads (Record): Control pads for :mod:`gateware.comm.Comm`.
         mem_depth (list[int]): Memory depths for the DAC channels.
+        fifo (int): Line FIFO depth of the DAC channels. See
+            :class:`gateware.dac.Dac`.
 
     Attributes:
         dacs (list): List of :mod:`gateware.dac.Dac`.
         comm (Module): :mod:`gateware.comm.Comm`.
     """
-    def __init__(self, ctrl_pads, mem_depths=(1 << 13, 1 << 13, 1 << 12)):
+    def __init__(self, ctrl_pads, mem_depths=(1 << 13, 1 << 13, 1 << 12),
+                 fifo=4):
         self.dacs = []
         for i, depth in enumerate(mem_depths):
-            dac = Dac(mem_depth=depth)
+            dac = Dac(mem_depth=depth, fifo=fifo)
             setattr(self.submodules, "dac{}".format(i), dac)
             self.dacs.append(dac)
         self.submodules.comm = Comm(ctrl_pads, self.dacs)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import struct
+
+try:
+    import asyncserial
+except ImportError:
+    asyncserial = None
+
+from .protocol import PDQBase, crc8, PDQ_CMD
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPDQ(PDQBase):
+    """Initialize PDQ USB/Parallel device stack with an asyncio interface.
+
+    Like :class:`pdq.host.usb.PDQ` but the device is written to from
+    coroutines and the event loop stays responsive while programming.
+
+    The synchronous :meth:`set_reg` and :meth:`write_mem` only frame the
+    message and append it to a queue. The coroutines (:meth:`write`,
+    :meth:`program`, :meth:`program_frame`, :meth:`upload`,
+    :meth:`set_config`, :meth:`set_crc`, :meth:`set_frame`) write the queue
+    to the device (see :meth:`drain`).
+
+    .. note:: This device should only be used if the PDQ is intended to be
+        configured using the USB connection and **not** via SPI.
+
+    Args:
+        url (str): Pyserial device URL. See :class:`pdq.host.usb.PDQ`.
+        dev (asyncserial.AsyncSerial): Device to use. Needs a
+            ``write_exactly()`` coroutine and a ``close()`` method. If
+            passed, ``url`` is ignored.
+        loop (asyncio.AbstractEventLoop): Event loop to use. Defaults to
+            the current event loop.
+        executor (concurrent.futures.Executor): Executor to encode channel
+            data in. Defaults to the loop's default executor.
+        length_prefix (bool): Frame messages with their length instead of
+            escaping them (see :meth:`pdq.host.usb.PDQ.write`). Requires
+            gateware support.
+        **kwargs: See :class:`PDQBase` .
+    """
+    def __init__(self, url=None, dev=None, loop=None, executor=None,
+                 length_prefix=False, **kwargs):
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        if dev is None:
+            if asyncserial is None:
+                raise ImportError("asyncserial is required to open a device")
+            dev = asyncserial.AsyncSerial(url, loop=loop)
+        self.dev = dev
+        self.executor = executor
+        self.length_prefix = length_prefix
+        self._queue = []
+        PDQBase.__init__(self, **kwargs)
+
+    def _frame(self, data):
+        logger.debug("> %r", data)
+        with self._span("escape"):
+            if self.length_prefix and len(data) <= 0xffff:
+                msg = b"\xa5\x04" + struct.pack("<H", len(data)) + data
+            else:
+                msg = (b"\xa5\x02" + data.replace(b"\xa5", b"\xa5\xa5") +
+                       b"\xa5\x03")
+        with self._span("crc"):
+            self.checksum = crc8(data, self.checksum)
+        self._count("bytes", len(data))
+        self._count("wire_bytes", len(msg))
+        self._queue.append(msg)
+
+    async def drain(self):
+        """Write the queued messages to the device."""
+        if self._queue:
+            msg = b"".join(self._queue)
+            self._queue.clear()
+            with self._span("device"):
+                await self.dev.write_exactly(msg)
+
+    async def write(self, data):
+        """Write data to the PDQ board over USB/parallel.
+
+        SOF/EOF control sequences are appended/prepended to
+        the (escaped) data. The running checksum is updated.
+        See :meth:`pdq.host.usb.PDQ.write` for :attr:`length_prefix`.
+
+        Args:
+            data (bytes): Data to write.
+        """
+        self._frame(data)
+        await self.drain()
+
+    def set_reg(self, adr, data, board):
+        self._frame(bytes([PDQ_CMD(board, 0, adr, 1), data]))
+
+    def write_mem(self, mem, adr, data, board=0xf):
+        self._frame(bytes([PDQ_CMD(board, 1, mem, 1), adr & 0xff, adr >> 8]) +
+                    data)
+
+    async def set_config(self, *args, **kwargs):
+        """See :meth:`PDQBase.set_config`."""
+        PDQBase.set_config(self, *args, **kwargs)
+        await self.drain()
+
+    async def set_crc(self, *args, **kwargs):
+        """See :meth:`PDQBase.set_crc`."""
+        PDQBase.set_crc(self, *args, **kwargs)
+        await self.drain()
+
+    async def set_frame(self, *args, **kwargs):
+        """See :meth:`PDQBase.set_frame`."""
+        PDQBase.set_frame(self, *args, **kwargs)
+        await self.drain()
+
+    async def program(self, program, channels=None, delta=False):
+        """See :meth:`PDQBase.program`.
+
+        The channels are encoded in the executor one memory (DAC index) at
+        a time. The images of one memory are written to the device while
+        the channels of the next memory are being encoded.
+        """
+        if channels is None:
+            channels = range(self.num_channels)
+        channels = list(channels)
+        compiled = key = None
+        if self.cache is not None:
+            key = self.cache.key(program, channels=channels,
+                                 num_dacs=self.num_dacs,
+                                 num_frames=self.num_frames, freq=self.freq,
+                                 escape_budget=self.escape_budget,
+                                 dedup=self.dedup)
+            compiled = self.cache.get(key)
+        if compiled is not None:
+            for channel, (data, state) in zip(channels, compiled):
+                self.channels[channel].restore(data, state)
+            self._update_channels(channels, compiled, delta)
+            await self.drain()
+            return
+        compiled = [None]*len(channels)
+        written = None
+        for mem in range(self.num_dacs):
+            select = [i for i, channel in enumerate(channels)
+                      if channel % self.num_dacs == mem]
+            if not select:
+                continue
+            part = await self.loop.run_in_executor(
+                self.executor, self.encode, program, channels, select)
+            if written is not None:
+                await written
+            for i, c in zip(select, part):
+                compiled[i] = c
+            self._update_channels([channels[i] for i in select], part, delta)
+            written = asyncio.ensure_future(self.drain(), loop=self.loop)
+        if written is not None:
+            await written
+        if self.cache is not None:
+            self.cache.put(key, compiled)
+
+    async def upload(self, channels, compiled, delta=False):
+        """See :meth:`PDQBase.upload`."""
+        PDQBase.upload(self, channels, compiled, delta)
+        await self.drain()
+
+    async def program_stream(self, program, channels=None,
+                             chunk_size=1 << 12):
+        """See :meth:`PDQBase.program_stream`.
+
+        Each chunk is written before the next one is generated.
+        """
+        for _ in self._iter_stream(program, channels, chunk_size):
+            await self.drain()
+
+    async def program_frame(self, frame, data, channels=None):
+        """See :meth:`PDQBase.program_frame`."""
+        try:
+            PDQBase.program_frame(self, frame, data, channels)
+        finally:
+            await self.drain()
+
+    def close(self):
+        """Close the USB device handle and stop the worker processes.
+        Queued messages are discarded."""
+        self._queue.clear()
+        self.dev.close()
+        del self.dev
+        PDQBase.close(self)
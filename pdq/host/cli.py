@@ -27,6 +27,7 @@ if __name__ == "__main__":
     sys.exit()
 
 
+import io
 import pprint
 import logging
 import numpy as np
@@ -38,6 +39,8 @@ except ImportError:
     interpolate = None
 
 from .usb import PDQ
+from .fit import fit
+from .report import report, format_report
 
 import argparse
 import time
@@ -61,6 +64,10 @@ def get_argparser():
     parser.add_argument("-o", "--order", default=3, type=int,
                         help="interpolation (0: const, 1: lin, 2: quad,"
                         " 3: cubic) [%(default)s]")
+    parser.add_argument("-l", "--tolerance", default=None, type=float,
+                        help="fit with few knots to within this absolute "
+                        "error (V) instead of a knot at each sample "
+                        "[%(default)s]")
     parser.add_argument("-a", "--aux-miso", default=False, action="store_true",
                         help="route MISO to AUX/F5 TTL output [%(default)s]")
     parser.add_argument("-k", "--aux-dac", default=0b111, type=int,
@@ -78,11 +85,38 @@ def get_argparser():
                         help="disarm group [%(default)s]")
     parser.add_argument("-e", "--free", default=False, action="store_true",
                         help="software trigger [%(default)s]")
+    parser.add_argument("-R", "--report", default=False, action="store_true",
+                        help="print memory occupancy and frame durations "
+                        "before uploading [%(default)s]")
+    parser.add_argument("-D", "--dry-run", default=False, action="store_true",
+                        help="do not open the device and do not upload "
+                        "[%(default)s]")
     parser.add_argument("-d", "--debug", default=False,
                         action="store_true", help="debug communications")
     return parser
 
 
+def interpolate_segment(times, voltages, order):
+    """Interpolate samples with a knot at each sample."""
+    dt = np.diff(times.astype(np.int))
+    if order and interpolate:
+        tck = interpolate.splrep(times, voltages, k=order, s=0)
+        u = interpolate.spalde(times, tck)
+    else:
+        u = voltages[:, None]
+    segment = []
+    for dti, ui in zip(dt, u):
+        segment.append({
+            "duration": int(dti),
+            "channel_data": [{
+                "bias": {
+                    "amplitude": [float(uij) for uij in ui]
+                }
+            }]
+        })
+    return segment
+
+
 def main(dev=None, args=None):
     """Test a PDQ stack.
 
@@ -99,7 +133,9 @@ def main(dev=None, args=None):
     else:
         logging.basicConfig(level=logging.WARNING)
 
-    if args.dump:
+    if args.dry_run:
+        dev = io.BytesIO()
+    elif args.dump:
         dev = open(args.dump, "wb")
     dev = PDQ(args.serial, dev)
 
@@ -114,30 +150,16 @@ def main(dev=None, args=None):
     freq = 50e6
     if args.multiplier:
         freq *= 2
+    dev.set_freq(freq)
 
     times = np.around(eval(args.times, globals(), {})*freq)
     voltages = eval(args.voltages, globals(), dict(t=times/freq))
 
-    dev.set_config(reset=False, clk2x=args.multiplier, enable=False,
-                   trigger=False, aux_miso=args.aux_miso,
-                   aux_dac=args.aux_dac, board=0xf)
-
-    dt = np.diff(times.astype(np.int))
-    if args.order and interpolate:
-        tck = interpolate.splrep(times, voltages, k=args.order, s=0)
-        u = interpolate.spalde(times, tck)
+    if args.tolerance is not None:
+        segment = fit(times.astype(np.int64), voltages, args.tolerance,
+                      args.order)
     else:
-        u = voltages[:, None]
-    segment = []
-    for dti, ui in zip(dt, u):
-        segment.append({
-            "duration": int(dti),
-            "channel_data": [{
-                "bias": {
-                    "amplitude": [float(uij) for uij in ui]
-                }
-            }]
-        })
+        segment = interpolate_segment(times, voltages, args.order)
     program = [[] for i in range(dev.channels[args.channel].num_frames)]
     program[args.frame] = segment
     if args.print:
@@ -147,9 +169,20 @@ def main(dev=None, args=None):
             f = open(args.print, 'w')
         print('# Generated WaveSynth program\n\nprogram = \\', file=f)
         pprint.pprint(program, f)
-    dev.program(program, [args.channel])
 
-    dev.set_frame(args.frame)
-    dev.set_config(reset=False, clk2x=args.multiplier, enable=not args.disarm,
-                   trigger=args.free, aux_miso=args.aux_miso,
-                   aux_dac=args.aux_dac, board=0xf)
+    compiled = dev.encode(program, [args.channel])
+    if args.report:
+        print(format_report(report(dev, [args.channel])))
+    if args.dry_run:
+        return
+
+    with dev.batch():
+        dev.set_config(reset=False, clk2x=args.multiplier, enable=False,
+                       trigger=False, aux_miso=args.aux_miso,
+                       aux_dac=args.aux_dac, board=0xf)
+        dev.upload([args.channel], compiled)
+        dev.set_frame(args.frame)
+        dev.set_config(reset=False, clk2x=args.multiplier,
+                       enable=not args.disarm, trigger=args.free,
+                       aux_miso=args.aux_miso, aux_dac=args.aux_dac,
+                       board=0xf)
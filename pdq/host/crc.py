@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class CRC:
     """Generic and simple table driven CRC calculator.
 
@@ -10,15 +13,22 @@ class CRC:
 
     Handle any variation on those details outside this class.
 
+    Byte messages of at least :attr:`min_chunked` bytes are split into
+    chunks. The CRCs of all chunks are computed in parallel with numpy and
+    then merged like :meth:`combine`.
+
     >>> r = CRC(0x1814141AB)(b"123456789")  # crc-32q
     >>> assert r == 0x3010BF7F, hex(r)
     """
+    min_chunked = 2048
+
     def __init__(self, poly, data_width=8):
         self.poly = poly
         self.crc_width = poly.bit_length() - 1
         self.data_width = data_width
         self._table = [self._one(i << self.crc_width - data_width)
                        for i in range(1 << data_width)]
+        self._zeros = []  # shift tables for 2**i zero words
 
     def _one(self, i):
         for j in range(self.data_width):
@@ -28,8 +38,102 @@ class CRC:
         return i
 
     def __call__(self, msg, crc=0):
+        if (self.data_width == 8 and self.crc_width <= 64 and
+                isinstance(msg, (bytes, bytearray, memoryview)) and
+                len(msg) >= self.min_chunked):
+            return self._chunked(msg, crc)
+        return self._serial(msg, crc)
+
+    def _serial(self, msg, crc=0):
         for data in msg:
             p = data ^ crc >> self.crc_width - self.data_width
             q = crc << self.data_width & (1 << self.crc_width) - 1
             crc = self._table[p] ^ q
         return crc
+
+    def _chunked(self, msg, crc):
+        data = np.frombuffer(msg, np.uint8)
+        # chunks of about sqrt(len)/4 bytes, a power of two
+        log_chunk = max(4, len(data).bit_length()//2 - 2)
+        chunk = 1 << log_chunk
+        n = len(data) >> log_chunk
+        log_n = (n - 1).bit_length()
+        # pad with leading zero chunks that do not change the result
+        chunks = np.zeros((chunk, 1 << log_n), np.uint8)
+        chunks[:, -n:] = data[:n << log_chunk].reshape(n, chunk).T
+        c = np.zeros(1 << log_n, np.uint64)
+        c[-n] = crc
+        if self.crc_width == 8:
+            table = np.array(self._table, np.uint8)
+            c = c.astype(np.uint8)
+            for d in chunks:
+                c = table[d ^ c]
+        else:
+            table = np.array(self._table, np.uint64)
+            mask = np.uint64((1 << self.crc_width) - 1)
+            shift = np.uint64(self.crc_width - 8)
+            for d in chunks:
+                c = table[d ^ (c >> shift)] ^ ((c << np.uint64(8)) & mask)
+        c = c.astype(np.uint64)
+        for i in range(log_n):
+            t = np.array(self._shift_table(log_chunk + i), np.uint64)
+            c0, c = c[0::2], c[1::2]
+            for j, tj in enumerate(t):
+                c = c ^ tj[(c0 >> np.uint64(8*j)) & np.uint64(0xff)]
+        crc = int(c[0])
+        return self._serial(memoryview(msg)[n << log_chunk:], crc)
+
+    def _shift_table(self, i):
+        """Shift table for ``2**i`` zero data words.
+
+        The shift is linear. It is tabulated for each ``data_width`` slice
+        of the CRC.
+        """
+        while len(self._zeros) <= i:
+            if self._zeros:
+                prev = self._zeros[-1]
+
+                def shift(crc):
+                    return self._apply(prev, self._apply(prev, crc))
+            else:
+                def shift(crc):
+                    return self._serial([0], crc)
+            self._zeros.append([
+                [shift(v << j) for v in range(1 << self.data_width)]
+                for j in range(0, self.crc_width, self.data_width)])
+        return self._zeros[i]
+
+    def _apply(self, table, crc):
+        r = 0
+        mask = (1 << self.data_width) - 1
+        for t in table:
+            r ^= t[crc & mask]
+            crc >>= self.data_width
+        return r
+
+    def zeros(self, crc, n):
+        """Advance a CRC over ``n`` zero data words.
+
+        Equivalent to ``self(bytes(n), crc)`` for ``data_width=8`` but
+        logarithmic in ``n``.
+        """
+        i = 0
+        while n:
+            if n & 1:
+                crc = self._apply(self._shift_table(i), crc)
+            n >>= 1
+            i += 1
+        return crc
+
+    def combine(self, crc1, crc2, n2):
+        """Combine the CRCs of two consecutive messages.
+
+        Args:
+            crc1 (int): CRC of the first message (with any initial value).
+            crc2 (int): CRC of the second message with zero initial value.
+            n2 (int): Length of the second message in data words.
+
+        Returns:
+            int: CRC of the concatenated message.
+        """
+        return self.zeros(crc1, n2) ^ crc2
@@ -0,0 +1,284 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Bit-exact emulation of a DAC channel.
+
+Reproduces the line timing of the :class:`pdq.gateware.dac.Parser` and the
+:class:`pdq.gateware.dac.Sequencer` and the evolution of the
+:class:`pdq.gateware.dac.Volt` and :class:`pdq.gateware.dac.Dds` executors
+(including the CORDIC) from a channel memory image. The per-cycle state is
+computed in closed form with numpy instead of cycle by cycle.
+"""
+
+from math import atan, pi
+
+import numpy as np
+
+from .protocol import disassemble
+
+
+# misoc.cores.cordic.Cordic(width=16, guard=None, eval_mode="pipelined")
+cordic_width = 16
+cordic_guard = 4
+cordic_stages = cordic_width + cordic_guard
+cordic_angles = [int(round(atan(2.**-i)*2**(cordic_width + cordic_guard - 1)
+                           / pi))
+                 for i in range(cordic_stages)]
+
+
+def _wrap(v, bits):
+    """Wrap to a signed integer of ``bits`` width."""
+    return ((v + (1 << bits - 1)) & ((1 << bits) - 1)) - (1 << bits - 1)
+
+
+def cordic(xi, zi):
+    """Rotate ``(xi, 0)`` by ``zi`` like the pipelined gateware CORDIC.
+
+    Args:
+        xi (array[int]): 16 bit signed amplitude.
+        zi (array[int]): 16 bit signed phase in units of ``pi/2**15``.
+
+    Returns:
+        array[int]: 16 bit signed ``x`` output, ``cordic_stages`` cycles
+        after the input.
+    """
+    xi = _wrap(np.asarray(xi, np.int64), 16)
+    zi = _wrap(np.asarray(zi, np.int64), 16)
+    # quadrant remapping
+    q = ((zi >> 14) ^ (zi >> 15)) & 1 == 1
+    x = np.where(q, _wrap(-xi, 16), xi) << cordic_guard
+    z = np.where(q, _wrap(zi + (1 << 15), 16), zi) << cordic_guard
+    y = np.zeros_like(x)
+    bits = cordic_width + cordic_guard
+    for i, a in enumerate(cordic_angles):
+        d = z < 0
+        dx, dy = y >> i, x >> i
+        x, y, z = (_wrap(x + np.where(d, dx, -dx), bits),
+                   _wrap(y + np.where(d, -dy, dy), bits),
+                   _wrap(z + np.where(d, a, -a), bits))
+    return x >> cordic_guard
+
+
+def _binom(n):
+    """Binomial coefficients ``C(n, 2)`` and ``C(n, 3)`` modulo ``2**64``.
+
+    Args:
+        n (array[int64]): Non-negative step counts.
+    """
+    a, b, c = n, n - 1, n - 2
+    odd = a & 1 == 1
+    c2 = np.where(odd, a, a >> 1).astype(np.uint64)*np.where(
+        odd, b >> 1, b).astype(np.uint64)
+    a = np.where(odd, a, a >> 1)
+    b = np.where(odd, b >> 1, b)
+    r = n % 3
+    a = np.where(r == 0, a//3, a)
+    b = np.where(r == 1, b//3, b)
+    c = np.where(r == 2, c//3, c)
+    c3 = a.astype(np.uint64)*b.astype(np.uint64)*c.astype(np.uint64)
+    return c2, c3
+
+
+# pdq.gateware.dac.Dac(fifo=...) default
+line_fifo = 4
+
+
+def read_cycles(header, addr=None):
+    """Cycles the Parser takes to read lines.
+
+    Two words are read per cycle. Lines starting at odd word addresses
+    take one more cycle.
+
+    Args:
+        header (array[int]): Line headers.
+        addr (array[int]): Line word addresses. If ``None``, all lines are
+            assumed at even addresses.
+
+    Returns:
+        array[int]: Cycles to read each line.
+    """
+    length = np.asarray(header, np.int64) & 0xf
+    odd = 0 if addr is None else np.asarray(addr, np.int64) & 1
+    return (length + 2 + odd) >> 1
+
+
+def schedule(header, duration, trigger=None, addr=None, fifo=line_fifo):
+    """Compute the line start times.
+
+    The Parser is started (in its ``JUMP`` state) and the Sequencer is
+    armed at cycle zero. After an end line, the Parser returns to the frame
+    table and continues with the next frame.
+
+    The Parser reads two words of a line per cycle (see
+    :class:`pdq.gateware.dac.Parser`) and submits the lines to the
+    Sequencer through a line FIFO of depth ``fifo``.
+
+    Args:
+        header (array[int]): Line headers.
+        duration (array[int]): Line durations.
+        trigger (array[int]): Sorted cycles at which the trigger input is
+            high. If ``None``, the trigger is always high.
+        addr (array[int]): Line word addresses. Lines at odd addresses take
+            one more cycle to read. If ``None``, all lines are assumed at even
+            addresses.
+        fifo (int): Line FIFO depth. ``0`` for no FIFO.
+
+    Returns:
+        tuple: ``(start, inc)``. ``start`` are the cycles at which the lines
+        are strobed into the executors (``-1`` if a line never starts for
+        lack of a trigger). ``inc`` are the cycles at which the executors
+        evolve.
+    """
+    header = np.asarray(header, np.int64)
+    duration = np.asarray(duration, np.int64)
+    shift = (header >> 9) & 0xf
+    steps = ((duration - 1) & 0xffff) + 1
+    reads = read_cycles(header, addr)
+    start = np.full(len(header), -1, np.int64)
+    incs = []
+    end, wait, stb, ack, busy = True, False, -1, -1, 0
+    for i in range(len(header)):
+        h = int(header[i])
+        if end:  # through the frame table once the FIFO is empty
+            parsed = stb + 3 + int(reads[i])
+        else:  # read while the previous line is waiting
+            parsed = ack + int(reads[i])
+        if fifo:
+            ack = parsed
+            if i >= fifo:
+                ack = max(ack, int(start[i - fifo]) + 1)
+            t = max(ack + 1, busy)
+        else:
+            t = max(parsed, busy)
+        if trigger is not None and (wait or h & (1 << 6)):
+            j = np.searchsorted(trigger, t)
+            if j == len(trigger):
+                break
+            t = max(t, int(trigger[j]))
+        if not fifo:
+            ack = t
+        if i and t > busy and not shift[i - 1] and steps[i - 1] > 1:
+            incs.append([busy])  # stall: one more evolution step
+        stb = start[i] = t
+        busy = t + (int(steps[i]) << int(shift[i]))
+        incs.append(t + (np.arange(1, steps[i]) << shift[i]))
+        end, wait = bool(h & (1 << 13)), bool(h & (1 << 15))
+    last = np.flatnonzero(start >= 0)
+    if len(last) and not shift[last[-1]] and steps[last[-1]] > 1:
+        incs.append([busy])
+    if incs:
+        inc = np.concatenate(incs).astype(np.int64)
+    else:
+        inc = np.zeros(0, np.int64)
+    return start, inc
+
+
+def _evolve(load, n, raw):
+    """Evaluate the amplitude accumulator.
+
+    Args:
+        load (array[int]): Index of the loaded line for each cycle or ``-1``.
+        n (array[int]): Evolution steps since the load.
+        raw (array[int]): Raw line coefficients.
+    """
+    if not len(raw):
+        return np.zeros(len(load), np.uint64)
+    v = raw[:, :4].astype(np.uint64) << np.array([32, 16, 0, 0], np.uint64)
+    c2, c3 = _binom(n)
+    acc = (v[load, 0] + n.astype(np.uint64)*v[load, 1] +
+           c2*v[load, 2] + c3*v[load, 3])
+    acc[load < 0] = 0
+    return acc
+
+
+def emulate(mem, frames=(0,), trigger=None, cycles=None, fifo=line_fifo):
+    """Emulate the output of a DAC channel.
+
+    Args:
+        mem (bytes): Channel memory image, e.g. from
+            :meth:`pdq.host.protocol.Channel.serialize`.
+        frames (list[int]): Frames to play in sequence. No further line is
+            started after the end of the last frame.
+        trigger (array[int]): Sorted cycles at which the trigger input is
+            high. If ``None``, the trigger is always high.
+        cycles (int): Number of clock cycles to emulate. Defaults to the
+            end of the last line plus the output latency.
+        fifo (int): Line FIFO depth. See :func:`schedule`.
+
+    Returns:
+        array[uint16]: Value of the DAC output data for each cycle.
+    """
+    lines = disassemble(mem, frames)
+    for frame, l in zip(frames, lines):
+        if not len(l):
+            raise ValueError("frame {} is empty".format(frame))
+    lines = np.concatenate(lines)
+    header = lines["header"].astype(np.int64)
+    duration = lines["duration"].astype(np.int64)
+    raw = lines["raw"]
+    start, inc = schedule(header, duration, trigger, lines["addr"], fifo)
+    ok = start >= 0
+    header, duration, raw, start = header[ok], duration[ok], raw[ok], \
+        start[ok]
+    if cycles is None:
+        cycles = cordic_stages + 2
+        if len(start):
+            cycles += int(start[-1] + ((((duration[-1] - 1) & 0xffff) + 1)
+                                       << ((header[-1] >> 9) & 0xf)))
+    t = np.arange(cycles)
+    count = np.zeros(cycles + 1, np.int64)
+    np.add.at(count, inc[inc < cycles] + 1, 1)
+    count = np.cumsum(count)  # evolution steps before each cycle
+    typ = (header >> 4) & 3
+
+    def load(sel):
+        # line index loaded in each executor and the steps since
+        s = np.concatenate([[0], start[sel] + 1])
+        j = np.searchsorted(s, t, "right") - 2
+        return j, count[t] - count[s[j + 1]]
+
+    j, n = load(typ == 0)
+    volt = _evolve(j, n, raw[typ == 0])
+    volt = ((volt >> np.uint64(32)) & np.uint64(0xffff)).astype(np.int64)
+
+    dds = typ == 1
+    j, n = load(dds)
+    d = raw[dds]
+    x = _evolve(j, n, d)
+    x = (x >> np.uint64(32)) & np.uint64(0xffff)
+    z0, z1, z2 = d[:, 4:].astype(np.uint64).T
+    if len(d):
+        z = z1[j] + n.astype(np.uint64)*z2[j]
+        z[j < 0] = 0
+        z0 = np.where(j < 0, 0, z0[j])
+    else:
+        z = z0 = np.zeros(cycles, np.uint64)
+    za = np.zeros(cycles + 1, np.uint64)
+    np.cumsum(z, out=za[1:])  # phase accumulated before each cycle
+    clear = np.concatenate([[0], start[dds][header[dds] & (1 << 14) != 0]
+                            + 1])
+    k = np.searchsorted(clear, t, "right") - 1
+    za = za[:-1] - za[clear[k]]
+    zi = (za >> np.uint64(16)) + z0
+    xo = cordic(x.astype(np.int64), (zi & np.uint64(0xffff)).astype(
+        np.int64))
+    xo = np.concatenate([np.zeros(cordic_stages, np.int64),
+                         xo[:cycles - cordic_stages]])
+
+    out = np.zeros(cycles, np.int64)
+    out[1:] = (volt + xo)[:-1]
+    return (out & 0xffff).astype(np.uint16)
@@ -0,0 +1,194 @@
+"""Upload time estimates for the USB and SPI links.
+
+The writes an upload consists of are obtained by programming a
+:class:`MessageLog` (see :func:`program_messages` and
+:func:`image_messages`). Their duration is then estimated for the FT245R
+USB/parallel link (:func:`usb_time`) or for the ARTIQ SPI link
+(:func:`spi_time`).
+
+Example::
+
+    messages = program_messages(program, dev=pdq)
+    if usb_time(messages) < dead_time:
+        pdq.program(program)
+"""
+
+from math import ceil
+
+from .protocol import PDQBase, PDQ_CMD
+
+
+# clock period in ns that pdq.gateware.ft245r.Ft245r_rx is instantiated with
+ft245r_clk = 10.
+
+
+def ft245r_cycles(clk=ft245r_clk, loop_delay=0):
+    """Clock cycles per byte read by the gateware FT245R reader.
+
+    Mirrors the timeline of :class:`pdq.gateware.ft245r.Ft245r_rx`: the
+    data is latched ``t_latch`` cycles after the read strobe is seen,
+    the strobe is dropped at ``t_drop`` and reading is re-enabled at
+    ``t_refill``. One cycle is needed to assert the read strobe and three
+    more for it to pass through the ``MultiReg`` and the timeline.
+
+    Args:
+        clk (float): Clock period in ns the reader was built with.
+        loop_delay (int): Additional cycles of read strobe delay through
+            the board stack.
+
+    Returns:
+        int: Cycles per byte.
+    """
+    t_latch = int(ceil(50/clk)) + 2
+    t_drop = t_latch + 2
+    t_refill = t_drop + int(ceil(50/clk))
+    return t_refill + 4 + loop_delay
+
+
+class MessageLog(PDQBase):
+    """PDQ stack that records the messages that would be written.
+
+    Attributes:
+        messages (list[tuple[bytes, bytes]]): Command and address bytes,
+            and memory data of each message.
+    """
+    def __init__(self, **kwargs):
+        PDQBase.__init__(self, **kwargs)
+        self.messages = []
+
+    def set_reg(self, adr, data, board):
+        self.messages.append((bytes([PDQ_CMD(board, 0, adr, 1), data]), b""))
+
+    def write_mem(self, mem, adr, data, board=0xf):
+        self.messages.append((bytes([PDQ_CMD(board, 1, mem, 1), adr & 0xff,
+                                     adr >> 8]), bytes(data)))
+
+
+def program_messages(program, channels=None, dev=None, delta=False,
+                     **kwargs):
+    """Record the messages that programming a wavesynth program writes.
+
+    Args:
+        program (list): Wavesynth program. See :meth:`PDQBase.program`.
+        channels (list[int]): Channel indices to use.
+        dev (PDQBase): Device to take the stack configuration, the
+            encoding options and the :attr:`PDQBase.shadow` memory contents
+            from. The shadow copies determine the delta writes. ``dev`` is
+            not modified.
+        delta (bool): See :meth:`PDQBase.program`.
+        **kwargs: Stack configuration if ``dev`` is not given. See
+            :class:`PDQBase`.
+
+    Returns:
+        list[tuple[bytes, bytes]]: See :attr:`MessageLog.messages`.
+    """
+    if dev is not None:
+        kwargs = dict(num_boards=dev.num_boards, num_dacs=dev.num_dacs,
+                      num_frames=dev.num_frames)
+    log = MessageLog(**kwargs)
+    if dev is not None:
+        log.freq = dev.freq
+        log.escape_budget = dev.escape_budget
+        log.dedup = dev.dedup
+        for ch, ref in zip(log.channels, dev.channels):
+            ch.max_data = ref.max_data
+        log.shadow = {k: bytearray(v) for k, v in dev.shadow.items()}
+    log.program(program, channels, delta)
+    return log.messages
+
+
+def image_messages(images):
+    """Messages to write full memory images.
+
+    Args:
+        images (dict[tuple[int, int], bytes]): Memory image for each
+            ``(board, mem)``.
+
+    Returns:
+        list[tuple[bytes, bytes]]: See :attr:`MessageLog.messages`.
+    """
+    log = MessageLog(num_boards=0)
+    for (board, mem), data in sorted(images.items()):
+        log.write_mem(mem, 0, data, board)
+    return log.messages
+
+
+def usb_bytes(messages, length_prefix=False):
+    """Number of bytes transferred over the USB/parallel link.
+
+    Each message is framed by two two-byte control sequences and each
+    ``0xa5`` byte in it is escaped into two bytes. With ``length_prefix``,
+    messages shorter than 64 KiB are prefixed by a two-byte control
+    sequence and their two-byte length and are not escaped. See
+    :meth:`pdq.host.usb.PDQ.write`.
+
+    Args:
+        messages (list[tuple[bytes, bytes]]): See :attr:`MessageLog.messages`.
+        length_prefix (bool): Length-prefixed framing.
+
+    Returns:
+        int: Bytes on the link.
+    """
+    n = 0
+    for head, data in messages:
+        n += 4 + len(head) + len(data)
+        if not length_prefix or len(head) + len(data) > 0xffff:
+            n += head.count(0xa5) + data.count(0xa5)
+    return n
+
+
+def usb_time(messages, freq=50e6, clk=ft245r_clk, loop_delay=0,
+             usb_rate=1e6, length_prefix=False):
+    """Estimate the upload time over the FT245R USB/parallel link.
+
+    The rate is limited by the gateware reader (see :func:`ft245r_cycles`)
+    and by the USB full-speed throughput of the FT245R.
+
+    Args:
+        messages (list[tuple[bytes, bytes]]): See :attr:`MessageLog.messages`.
+        freq (float): Gateware clock frequency in Hz (50 MHz, or 100 MHz
+            with ``clk2x``).
+        clk (float): See :func:`ft245r_cycles`.
+        loop_delay (int): See :func:`ft245r_cycles`.
+        usb_rate (float): Sustained USB throughput in bytes per second.
+        length_prefix (bool): See :func:`usb_bytes`.
+
+    Returns:
+        float: Upload time in seconds.
+    """
+    period = max(ft245r_cycles(clk, loop_delay)/freq, 1/usb_rate)
+    return usb_bytes(messages, length_prefix)*period
+
+
+def spi_time(messages, write_div=24, ref_period=8e-9, event_period=0.):
+    """Estimate the upload time over the ARTIQ SPI link.
+
+    Follows the timeline of :meth:`pdq.artiq.spi.PDQ.write_mem`: a 24 bit
+    command and address transfer followed by back to back 16 bit data
+    transfers, one SPI clock period and one reference period of chip
+    select high time. Register writes (:meth:`pdq.artiq.spi.PDQ.set_reg`)
+    are a single 16 bit transfer followed by one SPI clock period and one
+    reference period.
+
+    Args:
+        messages (list[tuple[bytes, bytes]]): See :attr:`MessageLog.messages`.
+        write_div (int): SPI write clock divider. See
+            :meth:`pdq.artiq.spi.PDQ.setup_bus`.
+        ref_period (float): RTIO reference period in seconds.
+        event_period (float): Minimum time the kernel needs to submit an
+            SPI transfer. If the SPI transfers are shorter, this limits
+            the rate.
+
+    Returns:
+        float: Upload time in seconds.
+    """
+    bit = write_div*ref_period
+    t = 0.
+    for head, data in messages:
+        if len(head) == 2:
+            t += max((16 + 1)*bit, event_period) + ref_period
+        else:
+            words = len(data)//2
+            t += (max(24*bit, event_period) +
+                  words*max(16*bit, event_period) + bit + ref_period)
+    return t
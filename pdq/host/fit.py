@@ -0,0 +1,230 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Adaptive fitting of sampled waveforms with few spline knots.
+
+Instead of placing a knot at every sample, :func:`fit` greedily extends
+each bias line over as many samples as possible while the quantized output
+of the line stays within a given tolerance of the samples.
+"""
+
+from math import factorial
+import warnings
+
+import numpy as np
+
+from .protocol import Segment, discrete_compensate
+
+
+def quantize(amplitude):
+    """Quantize bias line coefficients like :meth:`Segment.bias`.
+
+    Args:
+        amplitude (list[float]): Amplitude coefficients. See
+            :meth:`Segment.bias`.
+
+    Returns:
+        list[int]: Accumulator values in units of ``2**-32`` output steps.
+
+    Raises:
+        ValueError: If the coefficients exceed the accumulator ranges.
+    """
+    coef = [Segment.out_scale*a for a in amplitude]
+    discrete_compensate(coef)
+    ud = Segment.pack_array([0, 1, 2, 2], [coef])[0]
+    v = []
+    for i, width in enumerate([0, 1, 2, 2][:len(coef)]):
+        name = "c{}".format(i)
+        if width == 2:
+            vi = int(ud[name]["lo"]) | int(ud[name]["hi"]) << 16
+        else:
+            vi = int(ud[name]) << 16*(2 - width)
+        v.append(vi)
+    return v
+
+
+def evaluate(v, n):
+    """Evaluate the output of a bias line.
+
+    Args:
+        v (list[int]): Accumulator values as returned by :func:`quantize`.
+        n (array[int]): Accumulator evolution steps since the start of the
+            line.
+
+    Returns:
+        array[int]: DAC output values.
+    """
+    n = np.asarray(n, dtype=object)
+    acc = 0
+    binom = np.ones_like(n)
+    for i, vi in enumerate(v):
+        acc = acc + binom*vi
+        binom = binom*(n - i)//(i + 1)
+    acc = (acc + (1 << 47)) % (1 << 48) - (1 << 47)
+    return (acc >> 32).astype(np.int64)
+
+
+def _shift(duration, max_time=Segment.max_time):
+    for shift in range(16):
+        if duration >> shift < max_time and \
+                not duration & ((1 << shift) - 1):
+            return shift
+
+
+def fit_line(t, y, order, end=False):
+    """Fit a bias line to samples.
+
+    The line starts at ``t[0]`` and ends at ``t[-1]``. The sample at
+    ``t[-1]`` is generated by the next line and is only fitted if ``end``
+    is true.
+
+    Args:
+        t (array[int]): Sample times in clock cycles.
+        y (array[float]): Sample voltages.
+        order (int): Polynomial order.
+        end (bool): Also fit the last sample.
+
+    Returns:
+        tuple: Wavesynth line and maximum absolute error in Volt or
+        ``None`` if the line can not be represented.
+    """
+    duration = int(t[-1] - t[0])
+    shift = _shift(duration)
+    if shift is None:
+        return None
+    if not end:
+        t, y = t[:-1], y[:-1]
+    n = (t - t[0]) >> shift
+    order = min(order, len(t) - 1)
+    scale = max(1, n[-1])
+    c = np.polynomial.polynomial.polyfit(n/scale, y, order)
+    amplitude = [float(ci*factorial(i)/scale**i) for i, ci in enumerate(c)]
+    try:
+        v = quantize(amplitude)
+    except ValueError:
+        return None
+    err = np.fabs(evaluate(v, n)/Segment.out_scale - y).max()
+    line = {
+        "duration": duration >> shift,
+        "dac_divider": 1 << shift,
+        "channel_data": [{"bias": {"amplitude": amplitude}}],
+    }
+    return line, err
+
+
+def _split(t, y, max_gap=1 << 15):
+    # insert linearly interpolated samples into gaps that are too long for
+    # a single line
+    gap = np.diff(t)
+    n = (gap - 1)//max_gap  # inserted samples per gap
+    if not n.any():
+        return t, y
+    i = np.repeat(np.arange(len(gap)), n)
+    k = np.arange(len(i)) - np.repeat(np.cumsum(n) - n, n) + 1
+    ti = t[i] + k*max_gap
+    yi = y[i] + (y[i + 1] - y[i])*(ti - t[i])/gap[i]
+    j = np.searchsorted(t, ti)
+    return np.insert(t, j, ti), np.insert(y, j, yi)
+
+
+def fit(times, voltages, tolerance, order=3):
+    """Fit a sampled waveform with few bias lines.
+
+    Starting at the first sample, each line is greedily extended over as
+    many samples as possible for each polynomial order up to ``order``
+    while the quantized output stays within ``tolerance`` of the samples.
+    The longest line (and among those the one with the lowest order) is
+    chosen. The duration exponent (``dac_divider``) is chosen to be the
+    smallest that represents the line duration.
+
+    The output at each sample time is evaluated exactly as the device would
+    generate it. The last sample of each line is the first sample of the
+    next line. The lines span ``times[0]`` to ``times[-1]`` and the last
+    line also fits the last sample. Gaps between samples that are too long
+    for a single line are split at linearly interpolated samples.
+
+    If no line from a sample to the next meets the tolerance (e.g. if the
+    tolerance is below the output resolution), the best such line is used
+    and a warning is issued.
+
+    Args:
+        times (array[int]): Strictly increasing sample times in clock
+            cycles.
+        voltages (array[float]): Sample voltages.
+        tolerance (float): Maximum absolute output error in Volt.
+        order (int): Maximum polynomial order (0 to 3).
+
+    Returns:
+        list[dict]: Wavesynth lines.
+
+    Raises:
+        ValueError: If the voltages exceed the output range.
+    """
+    t = np.asarray(times, np.int64)
+    y = np.asarray(voltages, np.float64)
+    assert np.all(np.diff(t) > 0)
+    t, y = _split(t, y)
+    lines = []
+    i = 0
+    while i < len(t) - 1:
+        best = None
+        for k in range(order + 1):
+
+            def try_fit(j):
+                r = fit_line(t[i:j + 1], y[i:j + 1], k, j == len(t) - 1)
+                if r is not None and r[1] <= tolerance:
+                    return r[0]
+
+            # exponential search for the first failure, then bisect
+            good, bad = i, None
+            step = 1
+            while True:
+                j = min(i + step, len(t) - 1)
+                line = try_fit(j)
+                if line is None:
+                    bad = j
+                    break
+                good, good_line = j, line
+                if j == len(t) - 1:
+                    break
+                step *= 2
+            if bad is not None:
+                while bad - good > 1:
+                    j = (good + bad)//2
+                    line = try_fit(j)
+                    if line is None:
+                        bad = j
+                    else:
+                        good, good_line = j, line
+            if good > i and (best is None or good > best[0]):
+                best = good, good_line
+        if best is None:
+            # tolerance can not be met, use the best shortest line
+            j = i + 1
+            r = [fit_line(t[i:j + 1], y[i:j + 1], k, j == len(t) - 1)
+                 for k in range(order + 1)]
+            r = [ri for ri in r if ri is not None]
+            if not r:
+                raise ValueError("voltage out of range at time {}".format(
+                    t[i]))
+            line, err = min(r, key=lambda ri: ri[1])
+            warnings.warn("tolerance {} not met at time {}: error {}".format(
+                tolerance, t[i], err))
+            best = j, line
+        i, line = best
+        lines.append(line)
+    return lines
@@ -0,0 +1,204 @@
+"""Checks and repairs for lines that are too short to be read in time.
+
+While a line executes, the :class:`pdq.gateware.dac.Parser` reads the next
+line from memory (see :func:`pdq.host.emulator.read_cycles`). If the line
+is shorter than the time it takes to read the next one, the next line
+starts late: the output stalls for the missing cycles and the splines
+evolve one additional step.
+
+The checks assume that no lines have been buffered ahead in the line FIFO.
+This is the case at the start of a frame and after a run of short lines.
+Lines that are flagged may still start on time if enough lines have been
+buffered. See :func:`pdq.host.emulator.schedule` for the exact timing.
+
+Example::
+
+    late = lint_frame(frame)
+    if late.any():
+        frame = repair(frame, tolerance=1e-3)
+"""
+
+from math import log
+
+import numpy as np
+
+from .protocol import Segment, disassemble
+from .emulator import read_cycles
+from .fit import quantize, evaluate, fit_line
+
+
+# data words by number of amplitude and phase coefficients
+_amplitude_words = [0, 1, 3, 6, 9]
+_phase_words = [0, 1, 3, 5]
+
+
+def lint_lines(header, duration, addr=None):
+    """Find lines that start late because the preceding line is too short.
+
+    Args:
+        header (array[int]): Headers of consecutive lines.
+        duration (array[int]): Line durations.
+        addr (array[int]): Line word addresses. If ``None``, all lines are
+            assumed at odd addresses (the slowest to read).
+
+    Returns:
+        array[int]: Cycles by which each line starts late. Zero for the
+        first line and for lines following a line that returns to the frame
+        address table.
+    """
+    header = np.asarray(header, np.int64)
+    duration = np.asarray(duration, np.int64)
+    shift = (header >> 9) & 0xf
+    cycles = (((duration - 1) & 0xffff) + 1) << shift
+    reads = read_cycles(header, 1 if addr is None else addr)
+    late = np.zeros(len(header), np.int64)
+    if len(header) > 1:
+        late[1:] = np.maximum(reads[1:] - cycles[:-1], 0)
+        late[1:][header[:-1] & (1 << 13) != 0] = 0
+    return late
+
+
+def lint_channel(channel):
+    """Find lines of a programmed channel that start late.
+
+    Uses the channel's placed memory image (see
+    :meth:`pdq.host.protocol.Channel.serialize`).
+
+    Args:
+        channel (Channel): Channel to check.
+
+    Returns:
+        list[tuple[int, int, int]]: Frame index, word address and cycles
+        late of each line starting late.
+    """
+    data = channel.serialize(place=False)
+    table = np.frombuffer(data, "<u2", channel.num_frames)
+    used = np.flatnonzero(table)
+    r = []
+    for frame, lines in zip(used, disassemble(data, used)):
+        late = lint_lines(lines["header"], lines["duration"], lines["addr"])
+        for i in np.flatnonzero(late):
+            r.append((int(frame), int(lines["addr"][i]), int(late[i])))
+    return r
+
+
+def _words(data):
+    if "bias" in data:
+        return _amplitude_words[len(data["bias"].get("amplitude", []))]
+    if "dds" in data:
+        dds = data["dds"]
+        return (_amplitude_words[len(dds.get("amplitude", []))] +
+                _phase_words[len(dds.get("phase", []))])
+    raise ValueError("unsupported line target: {}".format(data))
+
+
+def lint_frame(frame):
+    """Find lines of a wavesynth frame that start late.
+
+    The line addresses are not known before the channels are programmed
+    and all lines are assumed at odd addresses. The line appended to each
+    frame by :meth:`pdq.host.protocol.PDQBase.program` is included.
+
+    Args:
+        frame (list[dict]): Wavesynth lines. See
+            :meth:`pdq.host.protocol.PDQBase.program`.
+
+    Returns:
+        array[int]: Cycles by which each line starts late on the slowest
+        channel. The last entry is the appended line.
+    """
+    header = []
+    duration = []
+    for line in frame:
+        words = max(_words(data) for data in line["channel_data"])
+        shift = int(log(line.get("dac_divider", 1), 2))
+        header.append(1 + words | shift << 9)
+        duration.append(line["duration"])
+    header.append(1)
+    duration.append(1)
+    return lint_lines(header, duration)
+
+
+def _output(line, channel):
+    shift = int(log(line.get("dac_divider", 1), 2))
+    n = np.arange(line["duration"] << shift) >> shift
+    amplitude = line["channel_data"][channel]["bias"].get("amplitude", [])
+    return evaluate(quantize(amplitude), n)/Segment.out_scale
+
+
+def merge(lines, tolerance, order=3):
+    """Fit consecutive bias lines with a single line.
+
+    The exact output of the lines (see :func:`pdq.host.fit.evaluate`) is
+    fitted on each channel (see :func:`pdq.host.fit.fit_line`).
+
+    Args:
+        lines (list[dict]): Consecutive wavesynth lines with only bias
+            targets. Only the first line may be triggered.
+        tolerance (float): Maximum absolute deviation in Volt from the
+            output of the lines.
+        order (int): Maximum polynomial order.
+
+    Returns:
+        dict: Wavesynth line or ``None`` if the lines can not be merged
+        within the tolerance.
+    """
+    if any(line.get("trigger", False) for line in lines[1:]):
+        return None
+    channels = len(lines[0]["channel_data"])
+    for line in lines:
+        if len(line["channel_data"]) != channels or any(
+                list(data) != ["bias"] for data in line["channel_data"]):
+            return None
+    channel_data = []
+    for i in range(channels):
+        y = np.concatenate([_output(line, i) for line in lines])
+        # the sample after the last line is not fitted
+        r = fit_line(np.arange(len(y) + 1), np.append(y, y[-1]), order)
+        if r is None or r[1] > tolerance:
+            return None
+        channel_data.extend(r[0]["channel_data"])
+    merged = dict(r[0], channel_data=channel_data)
+    if lines[0].get("trigger", False):
+        merged["trigger"] = True
+    return merged
+
+
+def repair(frame, tolerance, order=3):
+    """Merge short bias lines of a wavesynth frame.
+
+    Each line that starts late (see :func:`lint_frame`) is merged with the
+    preceding short line (see :func:`merge`). If that fails, the short line
+    is merged with the line before it instead.
+
+    Args:
+        frame (list[dict]): Wavesynth lines.
+        tolerance (float): Maximum absolute deviation in Volt of each merged
+            line from the output of the lines it replaces.
+        order (int): Maximum polynomial order of merged lines.
+
+    Returns:
+        list[dict]: Repaired wavesynth lines. Lines that can not be merged
+        are kept as they are.
+    """
+    frame = list(frame)
+    failed = set()
+    while True:
+        late = lint_frame(frame)
+        for i in np.flatnonzero(late):
+            i = int(i)
+            if i in failed:
+                continue
+            for j in i - 1, i - 2:  # merge frame[j:j + 2]
+                if j >= 0 and j + 2 <= len(frame):
+                    line = merge(frame[j:j + 2], tolerance, order)
+                    if line is not None:
+                        frame[j:j + 2] = [line]
+                        break
+            else:
+                failed.add(i)
+                continue
+            failed = set()
+            break
+        else:
+            return frame
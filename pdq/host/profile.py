@@ -0,0 +1,129 @@
+"""Timing and byte count collection for programming and transport.
+
+Assign a :class:`Profile` to :attr:`pdq.host.protocol.PDQBase.profile` to
+collect timing spans of the programming stages and byte counters. When no
+profile is set, the instrumentation reduces to an attribute check.
+
+The stages of :meth:`pdq.host.protocol.PDQBase.program` are ``cache``,
+``encode`` (per frame and channel), ``encode_parallel``, ``place`` and
+``serialize`` (per channel), ``restore`` (per channel), and ``update``
+(delta encoding and writing, including ``diff`` per channel). The
+transport stages ``escape``, ``crc`` and ``device`` are nested within
+``update``. The counters are ``image_bytes`` and ``mem_bytes`` (per channel) and the
+transport ``bytes`` and ``wire_bytes`` (escaped and framed).
+
+Example::
+
+    dev.profile = Profile()
+    dev.program(program)
+    logger.info("program: %s", dev.profile.as_dict())
+"""
+
+from threading import Lock
+from time import perf_counter
+
+
+class _NoSpan:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+no_span = _NoSpan()
+
+
+class _Span:
+    __slots__ = ("profile", "stage", "channel", "start")
+
+    def __init__(self, profile, stage, channel):
+        self.profile = profile
+        self.stage = stage
+        self.channel = channel
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.stage, perf_counter() - self.start,
+                         self.channel)
+
+
+class Profile:
+    """Collector of timing spans and counters.
+
+    Spans and counters are accumulated per stage name and, if given, per
+    channel index. They may be recorded from several threads (e.g. by
+    :class:`pdq.host.aio.AsyncPDQ`, which encodes in an executor).
+
+    Attributes:
+        spans (dict[str, list]): Number of spans and total seconds for each
+            stage.
+        counters (dict[str, int]): Total for each counter.
+        channels (dict[int, dict[str, float]]): Seconds and counter totals
+            for each stage and counter by channel.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.clear()
+
+    def clear(self):
+        """Reset all spans and counters."""
+        self.spans = {}
+        self.counters = {}
+        self.channels = {}
+
+    def span(self, stage, channel=None):
+        """Context manager timing a span of a stage.
+
+        Args:
+            stage (str): Stage name.
+            channel (int): Channel index the span is attributed to.
+        """
+        return _Span(self, stage, channel)
+
+    def add(self, stage, seconds, channel=None):
+        """Record a timing span.
+
+        Args:
+            stage (str): Stage name.
+            seconds (float): Duration of the span.
+            channel (int): Channel index the span is attributed to.
+        """
+        with self._lock:
+            span = self.spans.setdefault(stage, [0, 0.])
+            span[0] += 1
+            span[1] += seconds
+            if channel is not None:
+                ch = self.channels.setdefault(channel, {})
+                ch[stage] = ch.get(stage, 0.) + seconds
+
+    def count(self, name, n=1, channel=None):
+        """Increment a counter.
+
+        Args:
+            name (str): Counter name.
+            n (int): Increment.
+            channel (int): Channel index the count is attributed to.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if channel is not None:
+                ch = self.channels.setdefault(channel, {})
+                ch[name] = ch.get(name, 0) + n
+
+    def as_dict(self):
+        """Collected numbers as a dictionary of plain types.
+
+        Returns:
+            dict: ``spans`` with ``count`` and ``seconds`` for each stage,
+            ``counters``, and ``channels`` with the per-channel totals.
+        """
+        return {
+            "spans": {stage: {"count": n, "seconds": t}
+                      for stage, (n, t) in self.spans.items()},
+            "counters": dict(self.counters),
+            "channels": {channel: dict(v)
+                         for channel, v in self.channels.items()},
+        }
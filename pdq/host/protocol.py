@@ -1,8 +1,17 @@
+from collections import OrderedDict
 from math import log, sqrt
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import pickle
 import struct
+import tempfile
 import warnings
 
+import numpy as np
+
 try:
     from artiq.language.core import portable
 except ImportError:
@@ -10,6 +19,7 @@ except ImportError:
     portable = lambda f: f
 
 from .crc import CRC
+from .profile import no_span
 
 
 logger = logging.getLogger(__name__)
@@ -37,6 +47,20 @@ def discrete_compensate(c):
         raise ValueError("Only splines up to cubic order are supported.")
 
 
+# line header fields and widths, see pdq.gateware.dac.line_layout
+header_layout = [
+    ("length", 4),  # 1 + number of data words
+    ("typ", 2),
+    ("trigger", 1),
+    ("silence", 1),
+    ("aux", 1),
+    ("shift", 4),
+    ("end", 1),
+    ("clear", 1),
+    ("wait", 1),
+]
+
+
 class Segment:
     """Serialize the lines for a single Segment.
 
@@ -48,6 +72,17 @@ class Segment:
         cordic_gain (float): CORDIC amplitude gain.
         addr (int): Address assigned to this segment.
         data (bytes): Serialized segment data.
+        view (memoryview): Serialized segment data without copying. A view
+            into the line buffer that does not reflect lines appended later.
+        end (bool): The last line of this segment returns to the frame
+            address table.
+        escape_budget (float): Maximum additional output error in Volt
+            that :meth:`bias` and :meth:`dds` may introduce to avoid
+            ``0xa5`` bytes in the amplitude coefficients (see
+            :meth:`dither`). ``None`` disables dithering.
+        dither_errors (list[float]): Bound of the additional output error
+            in Volt of each line appended by :meth:`bias`, :meth:`dds` and
+            their vectorized versions while :attr:`escape_budget` is set.
     """
     max_time = 1 << 16  # uint16 timer
     max_val = 1 << 15  # int16 DAC
@@ -56,10 +91,41 @@ class Segment:
     cordic_gain = 1.
     for i in range(16):
         cordic_gain *= sqrt(1 + 2**(-2*i))
+    escape_budget = None
 
     def __init__(self):
-        self.data = b""
+        self._buf = bytearray(64)
+        self._size = 0
         self.addr = None
+        self.end = False
+        self.dither_errors = []
+
+    @property
+    def data(self):
+        return bytes(self.view)
+
+    @data.setter
+    def data(self, data):
+        self._buf = bytearray(data)
+        self._size = len(data)
+
+    @property
+    def view(self):
+        return memoryview(self._buf)[:self._size]
+
+    def _append(self, data):
+        """Append raw data to the line buffer.
+
+        The buffer capacity is doubled when it is exhausted.
+        Appending is amortized constant time per byte.
+        """
+        end = self._size + len(data)
+        if end > len(self._buf):
+            buf = bytearray(max(end, 2*len(self._buf)))
+            buf[:self._size] = self.view
+            self._buf = buf
+        self._buf[self._size:end] = data
+        self._size = end
 
     def line(self, typ, duration, data, trigger=False, silence=False,
              aux=False, shift=0, jump=False, clear=False, wait=False):
@@ -85,13 +151,57 @@ class Segment:
         """
         assert len(data) % 2 == 0, data
         assert len(data)//2 <= 14
-        # assert dt*(1 << shift) > 1 + len(data)//2
+        # lines too short to read the next one stall, see pdq.host.lint
         header = (
             1 + len(data)//2 | (typ << 4) | (trigger << 6) | (silence << 7) |
             (aux << 8) | (shift << 9) | (jump << 13) | (clear << 14) |
             (wait << 15)
         )
-        self.data += struct.pack("<HH", header, duration) + data
+        self._append(struct.pack("<HH", header, duration))
+        self._append(data)
+        self.end = bool(jump)
+
+    def line_array(self, typ, duration, data, trigger=False, silence=False,
+                   aux=False, shift=0, jump=False, clear=False, wait=False):
+        """Append many lines to this segment.
+
+        Vectorized version of :meth:`line`. The encoded lines are identical
+        to those generated by calling :meth:`line` for each line.
+
+        Args:
+            typ (int): Output module to target with these lines.
+            duration (array[int]): Durations of the lines. Shape ``(n,)``.
+            data (array): Packed line data as returned by
+                :meth:`pack_array`. Shape ``(n,)``.
+            trigger, silence, aux, shift, jump, clear, wait: See
+                :meth:`line`. Either scalars applying to all lines or arrays
+                of shape ``(n,)``.
+        """
+        n = len(data)
+        words = data.dtype.itemsize//2
+        assert data.dtype.itemsize % 2 == 0, data.dtype
+        assert words <= 14
+        duration = np.broadcast_to(np.asarray(duration, np.int64), (n,))
+        if np.any((duration < 0) | (duration >= self.max_time)):
+            raise ValueError("durations out of range")
+        shift = np.asarray(shift, np.int64)
+        assert np.all((shift >= 0) & (shift < 16)), shift
+        header = (
+            1 + words | (typ << 4) | (np.asarray(trigger, np.int64) << 6) |
+            (np.asarray(silence, np.int64) << 7) |
+            (np.asarray(aux, np.int64) << 8) | (shift << 9) |
+            (np.asarray(jump, np.int64) << 13) |
+            (np.asarray(clear, np.int64) << 14) |
+            (np.asarray(wait, np.int64) << 15)
+        )
+        lines = np.empty(n, [("header", "<u2"), ("duration", "<u2"),
+                             ("data", data.dtype)])
+        lines["header"] = header
+        lines["duration"] = duration
+        lines["data"] = data
+        self._append(memoryview(lines.view(np.uint8)))
+        if n:
+            self.end = bool(np.broadcast_to(jump, (n,))[-1])
 
     @staticmethod
     def pack(widths, values):
@@ -122,6 +232,123 @@ class Segment:
                          values, widths, ud, fmt, e)
             raise e
 
+    @staticmethod
+    def pack_array(widths, values):
+        """Pack spline data for many lines.
+
+        Vectorized version of :meth:`pack`. Each row of ``values`` is
+        quantized and packed exactly like :meth:`pack` would.
+
+        Args:
+            widths (list[int]): Widths of values in multiples of 16 bits.
+            values (array[float]): Values to pack. Shape ``(n, m)`` with
+                ``m <= len(widths)``.
+
+        Returns:
+            array: Structured array of shape ``(n,)`` with one field per
+            value. 48 bit values are split into ``lo`` and ``hi`` fields.
+        """
+        values = np.asarray(values, np.float64)
+        n, m = values.shape
+        assert m <= len(widths), (values.shape, widths)
+        fields = []
+        for i, width in enumerate(widths[:m]):
+            if width == 2:
+                fields.append(("c{}".format(i), [("lo", "<u2"),
+                                                 ("hi", "<i4")]))
+            else:
+                fields.append(("c{}".format(i), "<i{}".format(2 << width)))
+        ud = np.empty(n, fields)
+        for i, width in enumerate(widths[:m]):
+            value = np.rint(values[:, i] * (1 << 16*width))
+            limit = 1 << (16 + 16*width - 1)
+            bad = ~((value >= -limit) & (value < limit))
+            if np.any(bad):
+                j = np.flatnonzero(bad)[0]
+                logger.error("can not pack %s as %s", values[j], widths)
+                raise ValueError("value out of range in line {}".format(j))
+            value = value.astype(np.int64)
+            name = "c{}".format(i)
+            if width == 2:
+                ud[name]["lo"] = value & 0xffff
+                ud[name]["hi"] = value >> 16
+            else:
+                ud[name] = value
+        return ud
+
+    @staticmethod
+    def dither(widths, data, steps, budget, gain=1.):
+        """Nudge amplitude coefficients to avoid escape bytes.
+
+        Each ``0xa5`` byte in the USB/parallel framing is escaped into two
+        bytes (see :meth:`pdq.host.usb.PDQ.write`). Of each amplitude
+        coefficient (the first four values) containing a ``0xa5`` byte, the
+        most significant such byte is replaced by ``0xa4`` or ``0xa6`` and
+        the less significant bytes by ``0xff`` or ``0x00``, whichever is
+        closer. The change is only made if the accumulated output error
+        bound stays within the budget.
+
+        The output after ``n`` steps is ``c0 + n*c1 + n*(n - 1)/2*c2 +
+        n*(n - 1)*(n - 2)/6*c3`` (see :func:`discrete_compensate`). The
+        error bound is the sum of the absolute coefficient changes weighted
+        by their contributions after ``steps`` steps.
+
+        Line headers, durations and phase coefficients are not changed and
+        may still contain ``0xa5`` bytes.
+
+        Args:
+            widths (list[int]): Widths of values in multiples of 16 bits.
+            data (bytes): Data as packed by :meth:`pack`.
+            steps (int): Number of spline evolution steps of the line.
+            budget (float): Maximum additional output error in DAC LSB.
+            gain (float): Output change per amplitude coefficient unit.
+
+        Returns:
+            tuple[bytes, float]: Packed data and the bound of the additional
+            output error in DAC LSB.
+        """
+        data = bytearray(data)
+        error = 0.
+        offset = 0
+        for i, width in enumerate(widths[:4]):
+            n = 2*(width + 1)
+            field = data[offset:offset + n]
+            if 0xa5 in field:
+                k = n - 1 - field[::-1].index(0xa5)
+                v = int.from_bytes(bytes(field), "little")
+                base = v >> 8*(k + 1) << 8*(k + 1)
+                down = base | 0xa4 << 8*k | (1 << 8*k) - 1
+                up = base | 0xa6 << 8*k
+                weight = gain/(1 << 16*width)
+                for j in range(i):
+                    weight *= (steps - j)/(j + 1)
+                for u in sorted((down, up), key=lambda u: abs(u - v)):
+                    e = abs(u - v)*weight
+                    if error + e <= budget:
+                        data[offset:offset + n] = u.to_bytes(n, "little")
+                        error += e
+                        break
+            offset += n
+        return bytes(data), error
+
+    def _dither(self, widths, data, duration, gain=1.):
+        budget = self.escape_budget*self.out_scale
+        data, error = self.dither(widths, data, duration, budget, gain)
+        self.dither_errors.append(error/self.out_scale)
+        return data
+
+    def _dither_array(self, widths, data, duration, gain=1.):
+        budget = self.escape_budget*self.out_scale
+        raw = data.view(np.uint8).reshape(len(data), -1)
+        size = sum(2*(width + 1) for width in widths[:4])
+        duration = np.broadcast_to(duration, (len(data),))
+        errors = np.zeros(len(data))
+        for j in np.flatnonzero((raw[:, :size] == 0xa5).any(axis=1)):
+            d, errors[j] = self.dither(widths, raw[j].tobytes(),
+                                       int(duration[j]), budget, gain)
+            raw[j] = np.frombuffer(d, np.uint8)
+        self.dither_errors.extend(errors/self.out_scale)
+
     def bias(self, amplitude=[], **kwargs):
         """Append a bias line to this segment.
 
@@ -134,8 +361,28 @@ class Segment:
         coef = [self.out_scale*a for a in amplitude]
         discrete_compensate(coef)
         data = self.pack([0, 1, 2, 2], coef)
+        if self.escape_budget is not None:
+            data = self._dither([0, 1, 2, 2], data, kwargs["duration"])
         self.line(typ=0, data=data, **kwargs)
 
+    def bias_array(self, duration, amplitude, **kwargs):
+        """Append many bias lines to this segment.
+
+        Vectorized version of :meth:`bias`.
+
+        Args:
+            duration (array[int]): Line durations. Shape ``(n,)``.
+            amplitude (array[float]): Amplitude coefficients for each line.
+                Shape ``(n, order)``. See :meth:`bias`.
+            **kwargs: Passed to :meth:`line_array`.
+        """
+        coef = self.out_scale*np.asarray(amplitude, np.float64)
+        discrete_compensate(coef.T)
+        data = self.pack_array([0, 1, 2, 2], coef)
+        if self.escape_budget is not None:
+            self._dither_array([0, 1, 2, 2], data, duration)
+        self.line_array(typ=0, duration=duration, data=data, **kwargs)
+
     def dds(self, amplitude=[], phase=[], **kwargs):
         """Append a DDS line to this segment.
 
@@ -157,8 +404,37 @@ class Segment:
             assert len(amplitude) == 4
         coef += [p*self.max_val*2 for p in phase]
         data = self.pack([0, 1, 2, 2, 0, 1, 1], coef)
+        if self.escape_budget is not None:
+            data = self._dither([0, 1, 2, 2, 0, 1, 1], data,
+                                kwargs["duration"], self.cordic_gain)
         self.line(typ=1, data=data, **kwargs)
 
+    def dds_array(self, duration, amplitude, phase=None, **kwargs):
+        """Append many DDS lines to this segment.
+
+        Vectorized version of :meth:`dds`.
+
+        Args:
+            duration (array[int]): Line durations. Shape ``(n,)``.
+            amplitude (array[float]): Amplitude coefficients for each line.
+                Shape ``(n, order)``. See :meth:`dds`.
+            phase (array[float]): Phase coefficients for each line.
+                Shape ``(n, phase_order)``. See :meth:`dds`.
+            **kwargs: Passed to :meth:`line_array`.
+        """
+        scale = self.out_scale/self.cordic_gain
+        coef = scale*np.asarray(amplitude, np.float64)
+        discrete_compensate(coef.T)
+        if phase is not None and np.shape(phase)[1]:
+            assert coef.shape[1] == 4
+            phase = np.asarray(phase, np.float64)
+            coef = np.concatenate([coef, phase*self.max_val*2], axis=1)
+        data = self.pack_array([0, 1, 2, 2, 0, 1, 1], coef)
+        if self.escape_budget is not None:
+            self._dither_array([0, 1, 2, 2, 0, 1, 1], data, duration,
+                               self.cordic_gain)
+        self.line_array(typ=1, duration=duration, data=data, **kwargs)
+
 
 class Channel:
     """PDQ Channel.
@@ -167,38 +443,64 @@ class Channel:
         num_frames (int): Number of frames supported.
         max_data (int): Number of 16 bit data words per channel.
         segments (list[Segment]): Segments added to this channel.
+        frames (list[Segment]): Entry segments of the frames as last used
+            in :meth:`table` or :meth:`replace`. ``None`` if no frame table
+            has been generated since the last :meth:`clear`.
     """
     def __init__(self, max_data, num_frames):
         self.max_data = max_data
         self.num_frames = num_frames
         self.segments = []
+        self.frames = None
 
     def clear(self):
         """Remove all segments."""
         self.segments.clear()
+        self.frames = None
 
     def new_segment(self):
         """Create and attach a new :class:`Segment` to this channel.
 
+        The frame entries recorded by :meth:`table` are discarded.
+
         Returns:
             :class:`Segment`
         """
         segment = Segment()
         self.segments.append(segment)
+        self.frames = None
         return segment
 
-    def place(self):
+    def place(self, dedup=False):
         """Place segments contiguously.
 
         Assign segment start addresses and determine length of data.
 
+        With ``dedup``, segments that return to the frame address table (see
+        :attr:`Segment.end`) and have data identical to a previous such
+        segment are not stored again but share the address of the previous
+        segment. Segments that are entered by falling through from the
+        preceding segment are always placed.
+
+        Args:
+            dedup (bool): Deduplicate identical segments.
+
         Returns:
             int: Amount of memory in use on this channel.
         """
         addr = self.num_frames
+        placed = {}
+        fallthrough = False
         for segment in self.segments:
+            if dedup and segment.end:
+                key = segment.data
+                if key in placed and not fallthrough:
+                    segment.addr = placed[key]
+                    continue
+                placed.setdefault(key, addr)
             segment.addr = addr
-            addr += len(segment.data)//2
+            addr += len(segment.view)//2
+            fallthrough = not segment.end
         assert addr <= self.max_data, addr
         return addr
 
@@ -212,23 +514,29 @@ class Channel:
 
         The frame entry segments can be any segments in the channel.
 
+        The entry segments are recorded in :attr:`frames`.
+
         Args:
             entry (list[Segment]): List of initial segments for each frame.
-                If not specified, the first :attr:`num_frames` segments are
-                used as frame entry points.
+                If not specified, the entries in :attr:`frames` are used
+                or, if there are none, the first :attr:`num_frames`
+                segments.
 
         Returns:
             bytes: Frame address table.
         """
         table = [0] * self.num_frames
+        if entry is None:
+            entry = self.frames
         if entry is None:
             entry = self.segments
         for i, frame in enumerate(entry):
             if frame is not None:
                 table[i] = frame.addr
+        self.frames = list(entry) + [None]*(self.num_frames - len(entry))
         return struct.pack("<" + "H"*self.num_frames, *table)
 
-    def serialize(self, entry=None):
+    def serialize(self, entry=None, dedup=False, place=True):
         """Serialize the memory for this channel.
 
         Places the segments contiguously in memory after the frame table.
@@ -237,13 +545,432 @@ class Channel:
 
         Args:
             entry (list[Segment]): See :meth:`table`.
+            dedup (bool): See :meth:`place`.
+            place (bool): Place the segments. If false, the current segment
+                addresses are used and unused memory is zero-filled.
 
         Returns:
             bytes: Channel memory data.
         """
-        self.place()
-        data = b"".join([segment.data for segment in self.segments])
-        return self.table(entry) + data
+        if place:
+            self.place(dedup)
+        table = self.table(entry)
+        end = self.num_frames
+        for segment in self.segments:
+            end = max(end, segment.addr + len(segment.view)//2)
+        data = bytearray(2*end)
+        data[:len(table)] = table
+        for segment in self.segments:
+            data[2*segment.addr:2*segment.addr + len(segment.view)] = \
+                segment.view
+        return bytes(data)
+
+    def iter_serialize(self, chunk_size=1 << 12, entry=None, dedup=False):
+        """Serialize the memory for this channel incrementally.
+
+        Like :meth:`serialize` but the segments are always placed and the
+        memory data is generated in chunks instead of as a whole. The frame
+        address table comes first.
+
+        Args:
+            chunk_size (int): Number of bytes per chunk. Even. The last
+                chunk can be shorter.
+            entry (list[Segment]): See :meth:`table`.
+            dedup (bool): See :meth:`place`.
+
+        Yields:
+            bytes: Consecutive chunks of the channel memory data.
+        """
+        assert chunk_size > 0 and not chunk_size & 1, chunk_size
+        self.place(dedup)
+        pieces = [self.table(entry)]
+        addr = self.num_frames
+        for segment in self.segments:
+            if segment.addr == addr:  # not sharing a previous segment
+                pieces.append(segment.view)
+                addr += len(segment.view)//2
+        buf = bytearray()
+        for piece in pieces:
+            piece = memoryview(piece)
+            while piece:
+                n = chunk_size - len(buf)
+                buf += piece[:n]
+                piece = piece[n:]
+                if len(buf) == chunk_size:
+                    yield bytes(buf)
+                    buf.clear()
+        if buf:
+            yield bytes(buf)
+
+    def state(self):
+        """Describe the segment layout of this channel.
+
+        Together with the serialized memory this allows restoring the
+        segments and frames (see :meth:`restore`).
+
+        Returns:
+            tuple: Address, length in bytes, :attr:`Segment.end` and
+            :attr:`Segment.dither_errors` of each segment and the segment
+            index of each frame entry.
+        """
+        index = {id(segment): i for i, segment in enumerate(self.segments)}
+        segments = [(segment.addr, len(segment.view), segment.end,
+                     list(segment.dither_errors))
+                    for segment in self.segments]
+        frames = [None if frame is None else index[id(frame)]
+                  for frame in self.frames or []]
+        return segments, frames
+
+    def restore(self, data, state):
+        """Restore segments and frames from serialized memory.
+
+        The segment data is not copied: the segments refer to ``data``
+        until lines are appended to them. ``data`` must not be modified
+        afterwards.
+
+        Args:
+            data (bytes): Channel memory as returned by :meth:`serialize`.
+            state (tuple): Segment layout as returned by :meth:`state`.
+        """
+        segments, frames = state
+        self.clear()
+        data = memoryview(data)
+        for addr, length, end, errors in segments:
+            segment = self.new_segment()
+            segment._buf = data[2*addr:2*addr + length]
+            segment._size = length
+            segment.addr = addr
+            segment.end = end
+            segment.dither_errors = list(errors)
+        if frames:
+            self.frames = [None if i is None else self.segments[i]
+                           for i in frames]
+
+    def free(self):
+        """List the unused memory regions.
+
+        Returns:
+            list[tuple[int, int]]: Start address and length of each
+            free region, in order of increasing address.
+        """
+        used = sorted((segment.addr, len(segment.view)//2)
+                      for segment in self.segments)
+        regions = []
+        addr = self.num_frames
+        for start, length in used:
+            if start > addr:
+                regions.append((addr, start - addr))
+            addr = max(addr, start + length)
+        if addr < self.max_data:
+            regions.append((addr, self.max_data - addr))
+        return regions
+
+    def _share(self, segment):
+        if not segment.end:
+            return False
+        key = segment.data
+        for other in self.segments:
+            if other.end and other.data == key:
+                segment.addr = other.addr
+                self.segments.append(segment)
+                return True
+        return False
+
+    def allocate(self, segment):
+        """Attach a placed segment to the channel using best fit.
+
+        The segment is placed into the smallest free region that can
+        hold it. If an identical segment returning to the frame table is
+        already present, that one is shared (see :meth:`place`).
+
+        Args:
+            segment (Segment): Segment to allocate.
+
+        Returns:
+            bool: ``True`` if the segment data needs to be written,
+            ``False`` if an identical segment is shared.
+
+        Raises:
+            MemoryError: If there is no free region large enough.
+        """
+        if self._share(segment):
+            return False
+        size = len(segment.view)//2
+        fits = [(length, addr) for addr, length in self.free()
+                if length >= size]
+        if not fits:
+            raise MemoryError("no free region for {} words".format(size))
+        segment.addr = min(fits)[1]
+        self.segments.append(segment)
+        return True
+
+    def compact(self):
+        """Move segments to lower addresses to merge the free regions.
+
+        Segments keep their order in memory. Segments below the first free
+        region are not moved.
+
+        Returns:
+            list[Segment]: Segments that have been moved.
+        """
+        moved = []
+        addr = self.num_frames
+        blocks = {}
+        for segment in sorted(self.segments, key=lambda s: s.addr):
+            if segment.addr in blocks:
+                # shares the block of a previous segment
+                segment.addr = blocks[segment.addr]
+                continue
+            blocks[segment.addr] = addr
+            if segment.addr != addr:
+                segment.addr = addr
+                moved.append(segment)
+            addr += len(segment.view)//2
+        return moved
+
+    def replace(self, frame, segment, compact=True):
+        """Replace the entry segment of a frame.
+
+        The old segment is detached from the channel unless another frame
+        uses it. If an identical segment is present, it is shared.
+        Otherwise the new segment is written over the old one if it fits
+        there or it is allocated (see :meth:`allocate`), compacting
+        the memory if needed. All other segments remain in place unless
+        compaction is needed.
+
+        The frame address table must have been generated before (see
+        :meth:`table`).
+
+        Args:
+            frame (int): Frame index.
+            segment (Segment): New entry segment. Its last line must return
+                to the frame address table.
+            compact (bool): Allow compaction.
+
+        Returns:
+            list[tuple[int, bytes]]: Word addresses and data of the memory
+            regions that need to be written.
+
+        Raises:
+            MemoryError: If the segment does not fit. The channel is left
+                unchanged.
+        """
+        assert segment.end
+        old = self.frames[frame]
+        state = list(self.frames), [(s, s.addr) for s in self.segments]
+        if old is not None and self.frames.count(old) == 1:
+            assert old.end
+            self.segments.remove(old)
+        self.frames[frame] = segment
+        moved = []
+        size = len(segment.view)//2
+        try:
+            if self._share(segment):
+                pass
+            elif old is not None and any(
+                    addr <= old.addr and old.addr + size <= addr + length
+                    for addr, length in self.free()):
+                segment.addr = old.addr
+                self.segments.append(segment)
+                moved.append(segment)
+            else:
+                try:
+                    if self.allocate(segment):
+                        moved.append(segment)
+                except MemoryError:
+                    if not compact:
+                        raise
+                    moved = self.compact()
+                    if self.allocate(segment):
+                        moved.append(segment)
+        except MemoryError:
+            self.frames, segments = state
+            self.segments = [s for s, addr in segments]
+            for s, addr in segments:
+                s.addr = addr
+            raise
+        table = self.table()
+        writes = [(0, table)] if len(moved) > 1 else [
+            (frame, table[2*frame:2*frame + 2])]
+        return writes + [(s.addr, s.data) for s in moved]
+
+
+line_dtype = np.dtype(
+    [("addr", "<u2"), ("header", "<u2")] +
+    [(name, "u1") for name, width in header_layout] +
+    [("duration", "<u2"), ("data", "<u2", (14,)), ("raw", "<i8", (7,)),
+     ("amplitude", "<f8", (4,)), ("phase", "<f8", (3,))])
+
+
+def disassemble(data, frames):
+    """Decode a channel memory image into lines.
+
+    Inverse of :meth:`Channel.serialize`. The lines of each frame are
+    followed from the frame address table until the first line that
+    returns to the table.
+
+    Each line is a record of :data:`line_dtype` with fields:
+
+        * ``addr``: word address of the line
+        * ``header`` and its fields from :data:`header_layout`
+        * ``duration``
+        * ``data``: the data words, zero padded to 14
+        * ``raw``: the integer spline coefficients (16 bit amplitude
+          offset, 32 bit derivative, two 48 bit derivatives, 16 bit phase
+          offset, 32 bit frequency, 32 bit chirp)
+        * ``amplitude`` and ``phase``: the coefficients in the units of
+          :meth:`Segment.bias` and :meth:`Segment.dds` with the discrete time
+          compensation removed
+
+    Args:
+        data (bytes): Channel memory data.
+        frames (list[int]): Frames to decode.
+
+    Returns:
+        list[array]: Lines of each frame. Empty for unused frames.
+
+    Raises:
+        ValueError: If a frame runs past the end of the memory or contains
+            an invalid line.
+    """
+    words = np.frombuffer(data, "<u2")
+    w = memoryview(data).cast("B").cast("H")
+    n = len(w)
+    addr = []
+    split = []
+    for frame in frames:
+        adr = w[frame]
+        while adr:
+            if adr + 1 >= n:
+                raise ValueError("frame {} runs past the end".format(frame))
+            header = w[adr]
+            length = header & 0xf
+            if not length or adr + 1 + length > n:
+                raise ValueError("invalid line at {}".format(adr))
+            addr.append(adr)
+            if header & (1 << 13):
+                break
+            adr += 1 + length
+        split.append(len(addr))
+    addr = np.array(addr, np.int64)
+    lines = np.zeros(len(addr), line_dtype)
+    lines["addr"] = addr
+    header = words[addr].astype(np.int64)
+    lines["header"] = header
+    i = 0
+    for name, width in header_layout:
+        lines[name] = (header >> i) & ((1 << width) - 1)
+        i += width
+    lines["duration"] = words[addr + 1]
+    j = np.arange(14)
+    valid = j < lines["length"][:, None].astype(np.int64) - 1
+    d = np.where(valid, words[np.where(valid, addr[:, None] + 2 + j, 0)], 0)
+    lines["data"] = d
+    d = d.astype(np.int64)
+    raw = lines["raw"]
+    k = 0
+    for i, width in enumerate([0, 1, 2, 2, 0, 1, 1]):
+        v = 0
+        for m in range(width + 1):
+            v = v | d[:, k] << 16*m
+            k += 1
+        bits = 16*(width + 1)
+        raw[:, i] = v - ((v >> bits - 1) << bits)
+    c = raw*2.**(-16*np.array([0, 1, 2, 2, 0, 1, 1]))
+    # undo discrete_compensate()
+    c[:, 2] -= c[:, 3]
+    c[:, 1] -= c[:, 2]/2. + c[:, 3]/6.
+    scale = np.where(lines["typ"] == 1,
+                     Segment.out_scale/Segment.cordic_gain, Segment.out_scale)
+    lines["amplitude"] = c[:, :4]/scale[:, None]
+    lines["phase"] = c[:, 4:]/(2*Segment.max_val)
+    return np.split(lines, split[:-1]) if split else []
+
+
+class ProgramCache:
+    """Cache of compiled wavesynth programs.
+
+    Keeps the serialized channel memories and segment layouts of recently
+    used programs in memory, evicting the least recently used ones. An
+    optional on-disk store keeps them across sessions.
+
+    Args:
+        size (int): Maximum number of programs kept in memory.
+        path (str): Directory for the on-disk store. If ``None``, only the
+            in-memory cache is used.
+    """
+    def __init__(self, size=16, path=None):
+        self.size = size
+        self.path = path
+        self._cache = OrderedDict()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _canonical(obj):
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        raise TypeError("can not canonicalize {!r}".format(obj))
+
+    @classmethod
+    def key(cls, program, **params):
+        """Compute the cache key of a program.
+
+        Args:
+            program (list): Wavesynth program.
+            **params: Additional parameters that influence compilation.
+
+        Returns:
+            str: Hash of the canonicalized program and parameters.
+        """
+        data = json.dumps([program, params], sort_keys=True,
+                          separators=(",", ":"), default=cls._canonical)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".pickle")
+
+    def get(self, key):
+        """Look up a compiled program.
+
+        Returns:
+            The compiled program or ``None`` if not cached.
+        """
+        try:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        except KeyError:
+            pass
+        if self.path is None:
+            return None
+        try:
+            with open(self._file(key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        self._insert(key, value)
+        return value
+
+    def put(self, key, value):
+        """Store a compiled program."""
+        self._insert(key, value)
+        if self.path is not None:
+            with tempfile.NamedTemporaryFile(dir=self.path,
+                                             delete=False) as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(f.name, self._file(key))
+
+    def _insert(self, key, value):
+        self._cache[key] = value
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def clear(self):
+        """Empty the in-memory cache."""
+        self._cache.clear()
 
 
 @portable
@@ -266,6 +993,16 @@ PDQ_ADR_CRC = 1
 PDQ_ADR_FRAME = 2
 
 
+def _encode_worker(args):
+    config, options, max_data, program, channels, select = args
+    dev = PDQBase(**config)
+    for name, value in options.items():
+        setattr(dev, name, value)
+    for ch, m in zip(dev.channels, max_data):
+        ch.max_data = m
+    return dev.encode(program, channels, select)
+
+
 class PDQBase:
     """
     PDQ stack.
@@ -277,20 +1014,58 @@ class PDQBase:
         num_dacs (int): Number of DAC outputs per board.
         num_frames (int): Number of frames supported.
         channels (list[Channel]): List of :class:`Channel` in this stack.
+        shadow (dict): Copy of the memory contents written by
+            :meth:`update_mem` for each ``(board, mem)``.
+        cache (ProgramCache): Cache of compiled programs used by
+            :meth:`program`. ``None`` disables caching.
+        processes (int): Number of worker processes :meth:`program` encodes
+            the channels in. The worker pool is started when first needed
+            and stopped by :meth:`close`.
+        min_parallel (int): Minimum number of lines times channels of a
+            program to use the worker processes. Smaller programs are
+            encoded in the calling process.
+        profile (pdq.host.profile.Profile): Collector for timing spans and
+            byte counters of the programming stages and the transport.
+            ``None`` disables collection.
+        escape_budget (float): Maximum additional output error in Volt per
+            line to avoid escaped bytes in the amplitude coefficients (see
+            :attr:`Segment.escape_budget`). The error bound of each line is
+            recorded in :attr:`Segment.dither_errors`. ``None`` disables
+            dithering.
+        dedup (bool): Store identical frames of a channel only once (see
+            :meth:`Channel.place`).
     """
     freq = 50e6
+    min_parallel = 1 << 14
+    profile = None
+    escape_budget = None
+    dedup = False
 
     _mem_sizes = [None, (20,), (10, 10), (8, 6, 6)]  # 10kx16 units
+    # bytes of framing, command and address for each write_mem()
+    _write_overhead = 7
+    # highest start byte address of a write_mem() (16 bit)
+    _max_adr = 0xffff
 
-    def __init__(self, num_boards=3, num_dacs=3, num_frames=32):
+    def __init__(self, num_boards=3, num_dacs=3, num_frames=32, cache=None,
+                 processes=1):
         """Initialize PDQ stack.
 
         Args:
             num_boards (int): Number of boards in this stack.
             num_dacs (int): Number of DAC outputs per board.
             num_frames (int): Number of frames supported.
+            cache (ProgramCache): Compiled program cache.
+            processes (int): Number of processes to encode channels in.
+                ``None`` uses one per CPU. ``1`` encodes serially.
         """
         self.checksum = 0
+        self.shadow = {}
+        self.cache = cache
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.processes = processes
+        self._pool = None
         self.num_boards = num_boards
         self.num_dacs = num_dacs
         self.num_frames = num_frames
@@ -300,6 +1075,32 @@ class PDQBase:
                          for i in range(num_boards)
                          for j in range(num_dacs)]
 
+    def close(self):
+        """Stop the worker processes (see :attr:`processes`)."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # forking is unsafe in threaded processes
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            self._pool = ctx.Pool(self.processes)
+        return self._pool
+
+    def _span(self, stage, channel=None):
+        if self.profile is None:
+            return no_span
+        return self.profile.span(stage, channel)
+
+    def _count(self, name, n=1, channel=None):
+        if self.profile is not None:
+            self.profile.count(name, n, channel)
+
     @portable
     def get_num_boards(self):
         return self.num_boards
@@ -418,6 +1219,120 @@ class PDQBase:
         """
         return self.get_reg(PDQ_ADR_FRAME, board)
 
+    def diff_mem(self, old, new):
+        """Determine the address ranges where two memory images differ.
+
+        Ranges that are separated by fewer unchanged bytes than the
+        overhead of an additional :meth:`write_mem` are coalesced. Since
+        write addresses are 16 bit, ranges starting beyond ``0xffff`` are
+        merged into the last range starting below.
+
+        Args:
+            old (bytes): Previous memory image.
+            new (bytes): New memory image.
+
+        Returns:
+            list[tuple[int, int]]: Start and stop byte addresses of the
+            regions of ``new`` that need to be written.
+        """
+        n = min(len(old), len(new))//2
+        old = np.frombuffer(old, "<u2", n)
+        new = np.frombuffer(new, "<u2", len(new)//2)
+        changed = np.flatnonzero(old != new[:n])
+        changed = np.append(changed, np.arange(n, len(new)))
+        if not len(changed):
+            return []
+        gap = self._write_overhead//2
+        split = np.flatnonzero(np.diff(changed) > gap + 1)
+        start = changed[np.r_[0, split + 1]]
+        stop = changed[np.r_[split, -1]] + 1
+        far = np.flatnonzero(start > self._max_adr//2)
+        if len(far):
+            i = max(far[0] - 1, 0)
+            start = np.append(start[:i], min(start[i], self._max_adr//2))
+            stop = np.append(stop[:i], stop[-1])
+        return [(2*int(i), 2*int(j)) for i, j in zip(start, stop)]
+
+    def update_mem(self, mem, data, board):
+        """Write a memory image differentially.
+
+        The image is compared to the :attr:`shadow` copy of the memory and
+        only the changed regions are written (see :meth:`diff_mem`). The
+        shadow copy is updated. Memory beyond the end of ``data`` is left
+        unchanged.
+
+        If the memory content may have changed otherwise (e.g. when the
+        board was power cycled or written to through :meth:`write_mem`),
+        the :attr:`shadow` entries have to be cleared.
+
+        Args:
+            mem (int): Channel memory to write to.
+            data (bytes): Memory image starting at address 0.
+            board (int): Board to write to (0-0xe), 0xf for all boards.
+                When broadcasting, the shadow copies of all boards are
+                compared and updated.
+        """
+        if board == 0xf:
+            boards = range(self.num_boards)
+        else:
+            boards = [board]
+        olds = [self.shadow.get((i, mem)) for i in boards]
+        old = olds[0]
+        if any(o != old for o in olds[1:]):
+            old = None
+        channel = None if board == 0xf else board*self.num_dacs + mem
+        if old is None:
+            ranges = [(0, len(data))]
+        else:
+            with self._span("diff", channel):
+                ranges = self.diff_mem(old, data)
+        for start, stop in ranges:
+            self._count("mem_bytes", stop - start, channel)
+            self.write_mem(mem=mem, adr=start, data=bytes(data[start:stop]),
+                           board=board)
+        for i, old in zip(boards, olds):
+            self.shadow[(i, mem)] = bytearray(data) + (old or b"")[len(data):]
+
+    def _write_cost(self, old, new):
+        if old is None:
+            ranges = [(0, len(new))]
+        else:
+            ranges = self.diff_mem(old, new)
+        return sum(stop - start + self._write_overhead
+                   for start, stop in ranges)
+
+    def update_mems(self, mem, images):
+        """Write memory images to the same memory on several boards.
+
+        If all boards of the stack are written and some of them receive
+        identical images, the most common image is broadcast to all boards
+        at once if that needs fewer bytes than writing each board
+        separately. The boards with differing images are then updated
+        individually. See :meth:`update_mem`.
+
+        Args:
+            mem (int): Channel memory to write to.
+            images (dict[int, bytes]): Memory image for each board.
+        """
+        if len(images) == self.num_boards > 1:
+            groups = {}
+            for board in sorted(images):
+                groups.setdefault(bytes(images[board]), []).append(board)
+            data = max(groups, key=lambda d: (len(groups[d]),
+                                              -groups[d][0]))
+            separate = sum(self._write_cost(self.shadow.get((board, mem)), d)
+                           for board, d in images.items())
+            olds = [self.shadow.get((board, mem)) for board in images]
+            common = olds[0]
+            if any(o != common for o in olds[1:]):
+                common = None
+            broadcast = self._write_cost(common, data) + sum(
+                self._write_cost(data, d) for d in images.values())
+            if len(groups[data]) > 1 and broadcast < separate:
+                self.update_mem(mem=mem, data=data, board=0xf)
+        for board in sorted(images):
+            self.update_mem(mem=mem, data=images[board], board=board)
+
     def program_segments(self, segments, data):
         """Append the wavesynth lines to the given segments.
 
@@ -434,16 +1349,18 @@ class PDQBase:
             duration = line["duration"]
             trigger = line.get("trigger", False)
             for segment, data in zip(segments, line["channel_data"]):
-                silence = data.pop("silence", False)
-                if len(data) != 1:
+                segment.escape_budget = self.escape_budget
+                silence = data.get("silence", False)
+                targets = [target for target in data if target != "silence"]
+                if len(targets) != 1:
                     raise ValueError("only one target per channel and line "
                                      "supported")
-                for target, target_data in data.items():
+                for target in targets:
                     getattr(segment, target)(
                         shift=shift, duration=duration, trigger=trigger,
-                        silence=silence, **target_data)
+                        silence=silence, **data[target])
 
-    def program(self, program, channels=None):
+    def program(self, program, channels=None, delta=False):
         """Serialize a wavesynth program and write it to the channels
         in the stack.
 
@@ -453,6 +1370,17 @@ class PDQBase:
         is generated, the channels are serialized and their memories are
         written.
 
+        If a :attr:`cache` is set, previously compiled programs are looked
+        up there and are not serialized again.
+
+        Large programs are serialized in :attr:`processes` worker processes
+        in parallel (see :attr:`min_parallel`).
+
+        With ``delta`` only the memory regions that differ from the
+        previously written image are transferred (see :meth:`update_mem`).
+        Identical images for the same memory on all boards are broadcast
+        (see :meth:`update_mems`).
+
         Short single-cycle lines are prepended and appended to each frame to
         allow proper write interlocking and to assure that the memory reader
         can be reliably parked in the frame address table.
@@ -462,24 +1390,252 @@ class PDQBase:
             program (list): Wavesynth program to serialize.
             channels (list[int]): Channel indices to use. If unspecified, all
                 channels are used.
+            delta (bool): Only write changed memory regions. This relies on
+                the :attr:`shadow` copies matching the memory contents. If
+                false, the full images are written.
         """
         if channels is None:
             channels = range(self.num_channels)
-        chs = [self.channels[i] for i in channels]
+        compiled = key = None
+        if self.cache is not None:
+            with self._span("cache"):
+                key = self.cache.key(program, channels=list(channels),
+                                     num_dacs=self.num_dacs,
+                                     num_frames=self.num_frames,
+                                     freq=self.freq,
+                                     escape_budget=self.escape_budget,
+                                     dedup=self.dedup)
+                compiled = self.cache.get(key)
+        restore = True
+        if compiled is None:
+            compiled = self._encode_parallel(program, channels)
+            if compiled is None:
+                compiled = self.encode(program, channels)
+                restore = False
+            if self.cache is not None:
+                with self._span("cache"):
+                    self.cache.put(key, compiled)
+        if restore:
+            for channel, (data, state) in zip(channels, compiled):
+                with self._span("restore", channel):
+                    self.channels[channel].restore(data, state)
+        self.upload(channels, compiled, delta)
+
+    def upload(self, channels, compiled, delta=False):
+        """Write encoded channel memory images.
+
+        Together with :meth:`encode` this splits :meth:`program` into
+        encoding and writing, e.g. to inspect the encoded channels before
+        writing them.
+
+        Args:
+            channels (list[int]): Channel indices.
+            compiled (list[tuple]): Memory image and channel state of each
+                channel as returned by :meth:`encode`.
+            delta (bool): See :meth:`program`.
+        """
+        with self._span("update"):
+            self._update_channels(channels, compiled, delta)
+
+    def encode(self, program, channels, select=None):
+        """Serialize a wavesynth program for some channels.
+
+        The :class:`Channel` are cleared, the program is appended to them
+        (see :meth:`program`) and they are serialized. Nothing is written.
+
+        Args:
+            program (list): Wavesynth program to serialize.
+            channels (list[int]): Channel indices the ``channel_data`` of the
+                program lines refer to.
+            select (list[int]): Positions in ``channels`` to serialize. If
+                unspecified, all channels are serialized.
+
+        Returns:
+            list[tuple]: Memory image and :meth:`Channel.state` of each
+            selected channel.
+        """
+        chs = self._append_program(program, channels, select)
+        if select is None:
+            select = range(len(channels))
+        compiled = []
+        for i, ch in zip(select, chs):
+            with self._span("place", channels[i]):
+                ch.place(self.dedup)
+            with self._span("serialize", channels[i]):
+                data = ch.serialize(place=False)
+            self._count("image_bytes", len(data), channels[i])
+            compiled.append((data, ch.state()))
+        return compiled
+
+    def _encode_parallel(self, program, channels):
+        """Encode channels in :attr:`processes` worker processes.
+
+        The program is sent to each worker once. Each worker encodes a
+        share of the channels (see :meth:`encode`) and returns the memory
+        images and channel states. The worker pool is kept for later calls.
+
+        Returns:
+            list[tuple]: See :meth:`encode`. ``None`` if the program is too
+            small (see :attr:`min_parallel`) or only one process is to be
+            used.
+        """
+        n = min(self.processes, len(channels))
+        size = sum(len(frame) for frame in program)*len(channels)
+        if n <= 1 or size < self.min_parallel:
+            return None
+        config = dict(num_boards=self.num_boards, num_dacs=self.num_dacs,
+                      num_frames=self.num_frames)
+        options = dict(escape_budget=self.escape_budget, dedup=self.dedup)
+        max_data = [ch.max_data for ch in self.channels]
+        channels = list(channels)
+        selects = [list(range(i, len(channels), n)) for i in range(n)]
+        with self._span("encode_parallel"):
+            parts = self._get_pool().map(_encode_worker, [
+                (config, options, max_data, program, channels, select)
+                for select in selects])
+        compiled = [None]*len(channels)
+        for select, part in zip(selects, parts):
+            for i, c in zip(select, part):
+                compiled[i] = c
+        return compiled
+
+    def _append_program(self, program, channels, select=None):
+        if select is None:
+            select = range(len(channels))
+        chs = [self.channels[channels[i]] for i in select]
         for channel in chs:
             channel.clear()
         for frame in program:
             segments = [c.new_segment() for c in chs]
-            self.program_segments(segments, frame)
-            # append an empty line to stall the memory reader before jumping
-            # through the frame table (`wait` does not prevent reading
-            # the next line)
+            if len(select) != len(channels):
+                frame = [dict(line, channel_data=[
+                    line["channel_data"][i] for i in select])
+                    for line in frame]
+            if self.profile is None:
+                self.program_segments(segments, frame)
+            else:
+                # encode channel by channel to attribute the spans
+                for j, segment in enumerate(segments):
+                    with self._span("encode", channels[select[j]]):
+                        self.program_segments([segment], [dict(
+                            line, channel_data=line["channel_data"][j:j + 1])
+                            for line in frame])
+            # append an empty line to stall the memory reader before
+            # jumping through the frame table (`wait` does not prevent
+            # reading the next line)
             for segment in segments:
-                segment.line(typ=3, data=b"", trigger=True, duration=1, aux=1,
-                             jump=True)
-        for channel, ch in zip(channels, chs):
+                segment.line(typ=3, data=b"", trigger=True, duration=1,
+                             aux=1, jump=True)
+        return chs
+
+    def program_stream(self, program, channels=None, chunk_size=1 << 12):
+        """Serialize a wavesynth program and write it in bounded chunks.
+
+        Like :meth:`program` but the channels are encoded and written one
+        after the other. Each channel image is generated and written in
+        chunks of ``chunk_size`` bytes (see :meth:`Channel.iter_serialize`)
+        and collected into the :attr:`shadow` copy of its memory. The
+        segments of the channel are then restored from the shadow copy (see
+        :meth:`Channel.restore`), releasing their line buffers. Apart from
+        the shadow copies and the segments of the channel being encoded,
+        the memory used is bounded by the chunk size. Since write addresses
+        are 16 bit, the chunks beyond ``0xffff`` are written together with
+        the last chunk starting below.
+
+        The memories are written in full: the :attr:`cache`, delta
+        programming and broadcasting are not used.
+
+        Args:
+            program (list): Wavesynth program. See :meth:`program`.
+            channels (list[int]): Channel indices to use. If unspecified, all
+                channels are used.
+            chunk_size (int): Number of bytes per :meth:`write_mem`.
+        """
+        for _ in self._iter_stream(program, channels, chunk_size):
+            pass
+
+    def _iter_stream(self, program, channels, chunk_size):
+        # yields after each chunk written, see program_stream()
+        if channels is None:
+            channels = range(self.num_channels)
+        channels = list(channels)
+        for i, channel in enumerate(channels):
+            ch, = self._append_program(program, channels, [i])
+            board, mem = divmod(channel, self.num_dacs)
+            image = bytearray()
+            start = 0
+            for chunk in ch.iter_serialize(chunk_size, dedup=self.dedup):
+                # a chunk is written once the next one is known to start
+                # within the 16 bit address range
+                if start < len(image) <= self._max_adr:
+                    self.write_mem(mem=mem, adr=start,
+                                   data=bytes(image[start:]), board=board)
+                    start = len(image)
+                    yield
+                image += chunk
+            if start < len(image):
+                self.write_mem(mem=mem, adr=start, data=bytes(image[start:]),
+                               board=board)
+                yield
+            old = self.shadow.get((board, mem))
+            if old is not None:
+                image += old[len(image):]
+            self.shadow[(board, mem)] = image
+            ch.restore(image, ch.state())
+
+    def _update_channels(self, channels, compiled, delta=True):
+        images = [{} for i in range(self.num_dacs)]
+        for channel, (data, state) in zip(channels, compiled):
+            board, mem = divmod(channel, self.num_dacs)
+            if not delta:
+                self.shadow.pop((board, mem), None)
+            images[mem][board] = data
+        for mem, boards in enumerate(images):
+            if boards:
+                self.update_mems(mem, boards)
+
+    def program_frame(self, frame, data, channels=None):
+        """Serialize a single frame of a wavesynth program and replace that
+        frame on the channels in the stack.
+
+        The other frames of the channels are left in place. Only the data of
+        the new frame and the frame address table entry are written
+        (see :meth:`Channel.replace`). The channels must have been programmed
+        using :meth:`program` or :meth:`program_stream` before. Memories
+        without a :attr:`shadow` copy are written in full.
+
+        Args:
+            frame (int): Index of the frame to replace.
+            data (list): Wavesynth lines of the frame.
+            channels (list[int]): Channel indices to use. If unspecified, all
+                channels are used.
+
+        Raises:
+            MemoryError: If the frame does not fit into a channel. The
+                channels preceding it have already been updated.
+        """
+        if channels is None:
+            channels = range(self.num_channels)
+        chs = [self.channels[i] for i in channels]
+        segments = [Segment() for c in chs]
+        self.program_segments(segments, data)
+        for segment in segments:
+            segment.line(typ=3, data=b"", trigger=True, duration=1, aux=1,
+                         jump=True)
+        for channel, ch, segment in zip(channels, chs, segments):
             board, mem = divmod(channel, self.num_dacs)
-            self.write_mem(mem=mem, adr=0, data=ch.serialize(), board=board)
+            writes = ch.replace(frame, segment)
+            image = self.shadow.get((board, mem))
+            if image is None:
+                image = ch.serialize(place=False)
+            else:
+                image = bytearray(image)
+                for addr, data in writes:
+                    addr *= 2
+                    if len(image) < addr + len(data):
+                        image.extend(bytes(addr + len(data) - len(image)))
+                    image[addr:addr + len(data)] = data
+            self.update_mem(mem=mem, data=image, board=board)
 
     def ping(self):
         """Ping method returning True. Required for ARTIQ remote
@@ -0,0 +1,103 @@
+"""Memory occupancy and timing reports.
+
+Summarizes the memory used by the channels of a programmed
+:class:`pdq.host.protocol.PDQBase` and the nominal duration of each frame.
+"""
+
+import numpy as np
+
+from .protocol import disassemble
+from .lint import lint_lines
+
+
+def channel_report(channel, freq=50e6):
+    """Report memory occupancy and frame durations of a channel.
+
+    The lines of each frame are decoded from the channel's serialized
+    memory (see :func:`pdq.host.protocol.disassemble`). Lines shared by
+    several frames are counted in each of them.
+
+    Args:
+        channel (Channel): Channel to report on.
+        freq (float): Clock frequency in Hz.
+
+    Returns:
+        dict: ``max_data`` words, ``used`` words (including the frame
+        table), ``free`` words, ``largest_free`` contiguous words and for
+        each used frame in ``frames``: ``frame`` index, ``addr`` of the
+        first line, ``words``, ``lines``, ``cycles`` and ``seconds`` of the
+        nominal duration (excluding waits for triggers) and the number of
+        lines that may start ``late`` (see :func:`pdq.host.lint.lint_lines`).
+    """
+    data = channel.serialize(place=False)
+    table = np.frombuffer(data, "<u2", channel.num_frames)
+    used = np.flatnonzero(table)
+    frames = []
+    for i, lines in zip(used, disassemble(data, used)):
+        steps = ((lines["duration"].astype(np.int64) - 1) & 0xffff) + 1
+        cycles = int((steps << lines["shift"].astype(np.int64)).sum())
+        frames.append({
+            "frame": int(i),
+            "addr": int(table[i]),
+            "words": int((lines["length"].astype(np.int64) + 1).sum()),
+            "lines": len(lines),
+            "cycles": cycles,
+            "seconds": cycles/freq,
+            "late": int(np.count_nonzero(lint_lines(
+                lines["header"], lines["duration"], lines["addr"]))),
+        })
+    free = [length for addr, length in channel.free()]
+    return {
+        "max_data": channel.max_data,
+        "used": channel.max_data - sum(free),
+        "free": sum(free),
+        "largest_free": max(free, default=0),
+        "frames": frames,
+    }
+
+
+def report(dev, channels=None):
+    """Report memory occupancy and frame durations of a stack.
+
+    Args:
+        dev (PDQBase): Programmed stack.
+        channels (list[int]): Channel indices to report on. If unspecified,
+            all channels are reported.
+
+    Returns:
+        list[dict]: :func:`channel_report` of each channel with the
+        ``channel`` index added.
+    """
+    if channels is None:
+        channels = range(dev.num_channels)
+    r = []
+    for i in channels:
+        ch = channel_report(dev.channels[i], dev.freq)
+        ch["channel"] = i
+        r.append(ch)
+    return r
+
+
+def format_report(report):
+    """Format a report as a text table.
+
+    Args:
+        report (list[dict]): As returned by :func:`report`.
+
+    Returns:
+        str: One line per channel followed by one line per frame.
+    """
+    out = []
+    for ch in report:
+        out.append("channel {channel}: {used}/{max_data} words used, "
+                   "{free} free, largest free region {largest_free}"
+                   .format(**ch))
+        for f in ch["frames"]:
+            line = ("  frame {frame:2d}: addr {addr:5d}, "
+                    "{words:5d} words, {lines:4d} lines, "
+                    "{cycles:8d} cycles, {us:10.3f} us".format(
+                        us=f["seconds"]*1e6, **f))
+            if f["late"]:
+                line += ", {late} late".format(**f)
+            out.append(line)
+    return "\n".join(out)
@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 import logging
 import struct
 
@@ -22,29 +23,96 @@ class PDQ(PDQBase):
             ``/dev/ttyUSB0`` for a Linux serial port.
         dev (file-like): File handle to use as device. If passed, ``url``
             is ignored.
+        high_water (int): Size of the write buffer used in :meth:`batch`.
+            Buffered data is written to the device when the next message
+            does not fit.
+        length_prefix (bool): Frame messages with their length instead of
+            escaping them (see :meth:`write`). Requires gateware support.
         **kwargs: See :class:`PDQBase` .
     """
-    def __init__(self, url=None, dev=None, **kwargs):
+    def __init__(self, url=None, dev=None, high_water=1 << 16,
+                 length_prefix=False, **kwargs):
         if dev is None:
             dev = serial.serial_for_url(url)
         self.dev = dev
+        self.length_prefix = length_prefix
+        self._batch = 0
+        self._buf = bytearray(high_water)
+        self._size = 0
         PDQBase.__init__(self, **kwargs)
 
+    def _write(self, msg):
+        with self._span("device"):
+            written = self.dev.write(msg)
+        if isinstance(written, int):
+            assert written == len(msg), (written, len(msg))
+
+    def _drain(self):
+        if self._size:
+            self._write(memoryview(self._buf)[:self._size])
+            self._size = 0
+
+    @contextmanager
+    def batch(self):
+        """Context manager collecting writes into one device write.
+
+        Within the context, framed messages are collected in the write
+        buffer. They are written to the device when the buffer is full and
+        when the outermost context exits. Contexts can be nested.
+
+        Example::
+
+            with pdq.batch():
+                pdq.set_config(enable=False)
+                pdq.program(program)
+                pdq.set_config(enable=True)
+        """
+        self._batch += 1
+        try:
+            yield
+        finally:
+            self._batch -= 1
+            if not self._batch:
+                self._drain()
+
     def write(self, data):
         """Write data to the PDQ board over USB/parallel.
 
         SOF/EOF control sequences are appended/prepended to
         the (escaped) data. The running checksum is updated.
 
+        With :attr:`length_prefix`, messages shorter than 64 KiB are
+        instead prefixed by the length-prefix control sequence and their
+        16 bit length and are not escaped.
+
+        Within :meth:`batch`, the message is buffered.
+
         Args:
             data (bytes): Data to write.
         """
         logger.debug("> %r", data)
-        msg = b"\xa5\x02" + data.replace(b"\xa5", b"\xa5\xa5") + b"\xa5\x03"
-        written = self.dev.write(msg)
-        if isinstance(written, int):
-            assert written == len(msg), (written, len(msg))
-        self.checksum = crc8(data, self.checksum)
+        with self._span("escape"):
+            if self.length_prefix and len(data) <= 0xffff:
+                msg = b"\xa5\x04" + struct.pack("<H", len(data)) + data
+            else:
+                msg = (b"\xa5\x02" + data.replace(b"\xa5", b"\xa5\xa5") +
+                       b"\xa5\x03")
+        with self._span("crc"):
+            self.checksum = crc8(data, self.checksum)
+        self._count("bytes", len(data))
+        self._count("wire_bytes", len(msg))
+        if not self._batch:
+            self._write(msg)
+            return
+        end = self._size + len(msg)
+        if end > len(self._buf):
+            self._drain()
+            end = len(msg)
+            if end > len(self._buf):
+                self._write(msg)
+                return
+        self._buf[self._size:end] = msg
+        self._size = end
 
     def set_reg(self, adr, data, board):
         self.write(bytes([PDQ_CMD(board, 0, adr, 1), data]))
@@ -53,11 +121,29 @@ class PDQ(PDQBase):
         self.write(bytes([PDQ_CMD(board, 1, mem, 1), adr & 0xff, adr >> 8]) +
                 data)
 
+    def program(self, program, channels=None, delta=False):
+        """See :meth:`PDQBase.program`. The writes are batched."""
+        with self.batch():
+            PDQBase.program(self, program, channels, delta)
+
+    def program_stream(self, program, channels=None, chunk_size=1 << 12):
+        """See :meth:`PDQBase.program_stream`. The writes are batched."""
+        with self.batch():
+            PDQBase.program_stream(self, program, channels, chunk_size)
+
+    def program_frame(self, frame, data, channels=None):
+        """See :meth:`PDQBase.program_frame`. The writes are batched."""
+        with self.batch():
+            PDQBase.program_frame(self, frame, data, channels)
+
     def close(self):
-        """Close the USB device handle."""
+        """Close the USB device handle and stop the worker processes."""
+        self._drain()
         self.dev.close()
         del self.dev
+        PDQBase.close(self)
 
     def flush(self):
-        """Flush pending data."""
+        """Flush pending data, including buffered writes."""
+        self._drain()
         self.dev.flush()
@@ -0,0 +1,316 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Host encoding and transport benchmarks.
+
+Run with ``python -m pdq.test.benchmark``. The results are compared
+against the reference baseline ``benchmark_baseline.json`` next to this
+file. It records the machine it was measured on; timings from a different
+machine are only indicative. Record a local baseline with
+``-o baseline.json`` and compare later runs against it with
+``-b baseline.json`` (``-b ""`` skips the comparison). The exit status is
+non-zero if any benchmark is slower or uses more memory than the baseline
+by more than the threshold.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from pdq.host.protocol import PDQBase, Segment, Channel, crc8
+from pdq.host.usb import PDQ
+
+
+default_baseline = os.path.join(os.path.dirname(__file__),
+                                "benchmark_baseline.json")
+
+
+def bench_segment_line(max_data, repeat=3):
+    """Time appending lines to a :class:`Segment` until it fills
+    ``max_data`` words.
+
+    Returns:
+        list[tuple]: ``(lines, words, seconds)`` for doubling line counts.
+    """
+    words_per_line = 3  # header, duration, constant bias
+    lines = [1 << i for i in range(6, 16)
+             if words_per_line << i < max_data]
+    lines.append(max_data//words_per_line)
+    r = []
+    for n in lines:
+        t = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            segment = Segment()
+            for j in range(n):
+                segment.bias(amplitude=[1.], duration=10)
+            t.append(time.perf_counter() - t0)
+            assert len(segment.view) == 2*words_per_line*n
+        r.append((n, words_per_line*n, min(t)))
+    return r
+
+
+def measure(setup, repeat=3):
+    """Time a benchmark and measure its peak memory.
+
+    Args:
+        setup (callable): Returns the function to measure. Its set-up is not
+            measured.
+        repeat (int): Number of timed runs. The fastest is reported.
+
+    Returns:
+        dict: ``seconds`` of the fastest run and ``peak`` traced memory in
+        bytes of an additional run.
+    """
+    t = []
+    for i in range(repeat):
+        fn = setup()
+        t0 = time.perf_counter()
+        fn()
+        t.append(time.perf_counter() - t0)
+    fn = setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(t), "peak": peak}
+
+
+class NullDev:
+    """Device that discards writes."""
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_program(num_channels, num_frames=8, num_lines=64, seed=0):
+    """Generate a synthetic program of cubic bias and DDS lines.
+
+    Even channels get bias lines, odd channels DDS lines.
+    """
+    rng = np.random.RandomState(seed)
+    program = []
+    for i in range(num_frames):
+        frame = []
+        for j in range(num_lines):
+            channel_data = []
+            for k in range(num_channels):
+                a = rng.uniform(-1, 1, 4)*[1, 1e-3, 1e-7, 1e-11]
+                if k % 2:
+                    data = {"dds": {"amplitude": list(a),
+                                    "phase": list(rng.uniform(0, 1e-2, 3)
+                                                  * [1, 1e-1, 1e-6])}}
+                else:
+                    data = {"bias": {"amplitude": list(a)}}
+                channel_data.append(data)
+            frame.append({"duration": int(rng.randint(10, 1000)),
+                          "trigger": j == 0, "channel_data": channel_data})
+        program.append(frame)
+    return program
+
+
+def benchmarks(num_lines=1 << 12):
+    """Build the benchmarks.
+
+    Returns:
+        list[tuple]: ``(name, setup)`` for use with :func:`measure`.
+    """
+    r = []
+    rng = np.random.RandomState(0)
+    coef = rng.uniform(-1, 1, (num_lines, 7))*(1 << 14)
+
+    def pack():
+        def run():
+            for c in coef:
+                Segment.pack([0, 1, 2, 2, 0, 1, 1], c)
+        return run
+    r.append(("Segment.pack", pack))
+
+    def pack_array():
+        return lambda: Segment.pack_array([0, 1, 2, 2, 0, 1, 1], coef)
+    r.append(("Segment.pack_array", pack_array))
+
+    amplitude = rng.uniform(-1, 1, (num_lines, 4))*[1, 1e-3, 1e-7, 1e-11]
+    phase = rng.uniform(0, 1e-2, (num_lines, 3))*[1, 1e-1, 1e-6]
+    duration = rng.randint(10, 1000, num_lines)
+
+    def bias():
+        def run():
+            segment = Segment()
+            for a, d in zip(amplitude, duration):
+                segment.bias(amplitude=list(a), duration=int(d))
+        return run
+    r.append(("Segment.bias", bias))
+
+    def dds():
+        def run():
+            segment = Segment()
+            for a, p, d in zip(amplitude, phase, duration):
+                segment.dds(amplitude=list(a), phase=list(p),
+                            duration=int(d))
+        return run
+    r.append(("Segment.dds", dds))
+
+    for num_dacs in 1, 2, 3:
+        def serialize(num_dacs=num_dacs):
+            max_data = PDQBase(num_boards=1, num_dacs=num_dacs).channels[
+                0].max_data
+            ch = Channel(max_data, num_frames=32)
+            n = (max_data - 32)//(32*11)  # fill with cubic bias lines
+            for i in range(32):
+                a = np.roll(amplitude, i, axis=0)[:n]
+                ch.new_segment().bias_array(duration[:n], a, jump=True)
+            return lambda: ch.serialize()
+        r.append(("Channel.serialize[dacs={}]".format(num_dacs),
+                  serialize))
+
+    for num_dacs in 1, 2, 3:
+        for num_boards in 1, 4, 16:
+            program = make_program(num_dacs*num_boards)
+
+            def program_(num_dacs=num_dacs, num_boards=num_boards,
+                         program=program):
+                dev = PDQ(dev=NullDev(), num_boards=num_boards,
+                          num_dacs=num_dacs, num_frames=8)
+                p = copy.deepcopy(program)
+                return lambda: dev.program(p)
+            r.append(("PDQBase.program[dacs={},boards={}]".format(
+                num_dacs, num_boards), program_))
+
+    data = rng.randint(0, 256, 1 << 16).astype(np.uint8).tobytes()
+
+    def crc():
+        return lambda: crc8(data)
+    r.append(("crc8[64KiB]", crc))
+
+    def write():
+        dev = PDQ(dev=NullDev())
+        chunks = [data[i:i + 4096] for i in range(0, len(data), 4096)]
+
+        def run():
+            for chunk in chunks:
+                dev.write(chunk)
+        return run
+    r.append(("PDQ.write[64KiB]", write))
+    return r
+
+
+def compare(results, baseline, threshold=.2):
+    """Compare benchmark results against a baseline.
+
+    Args:
+        results (dict): Benchmark results by name.
+        baseline (dict): Baseline results by name.
+        threshold (float): Maximum relative increase.
+
+    Returns:
+        list[tuple]: ``(name, key, baseline, result)`` for each regression.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for key in "seconds", "peak":
+            old, new = baseline[name][key], result[key]
+            if new > old*(1 + threshold):
+                regressions.append((name, key, old, new))
+    return regressions
+
+
+def machine():
+    """Describe the machine benchmarks run on."""
+    return "{} {}, {} CPUs".format(platform.platform(),
+                                   platform.processor() or
+                                   platform.machine(), os.cpu_count())
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="write results to JSON file")
+    parser.add_argument("-b", "--baseline", default=default_baseline,
+                        help="compare to JSON file [%(default)s]")
+    parser.add_argument("-t", "--threshold", default=.2, type=float,
+                        help="relative regression threshold [%(default)s]")
+    parser.add_argument("-r", "--repeat", default=3, type=int,
+                        help="timed runs per benchmark [%(default)s]")
+    parser.add_argument("-k", "--select", default="",
+                        help="only run benchmarks matching this regex")
+    parser.add_argument("--scaling", action="store_true",
+                        help="also print Segment.bias() scaling")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    results = {}
+    print("{:40s} {:>10s} {:>10s}".format("benchmark", "ms", "peak KiB"))
+    for name, setup in benchmarks():
+        if not re.search(args.select, name):
+            continue
+        results[name] = r = measure(setup, args.repeat)
+        print("{:40s} {:10.3f} {:10.1f}".format(
+            name, r["seconds"]*1e3, r["peak"]/1024))
+
+    if args.scaling:
+        max_data = PDQBase(num_boards=1, num_dacs=1).channels[0].max_data
+        print()
+        print("Segment.bias() into one segment, max_data={}".format(
+            max_data))
+        print("{:>8s} {:>8s} {:>10s} {:>10s}".format(
+            "lines", "words", "ms", "us/line"))
+        for n, words, t in bench_segment_line(max_data):
+            print("{:8d} {:8d} {:10.3f} {:10.3f}".format(
+                n, words, t*1e3, t/n*1e6))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"machine": machine(),
+                       "python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "results": results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("machine") != machine():
+            print("baseline measured on a different machine: {}".format(
+                baseline.get("machine")))
+        regressions = compare(results, baseline["results"], args.threshold)
+        for name, key, old, new in regressions:
+            print("regression: {} {} {:g} -> {:g} ({:+.0%})".format(
+                name, key, old, new, new/old - 1))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
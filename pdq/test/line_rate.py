@@ -0,0 +1,238 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Parser line rate benchmark in gateware simulation.
+
+Run with ``python -m pdq.test.line_rate``. For bias and DDS lines of each
+number of data words, a :class:`pdq.gateware.dac.Dac` channel is simulated
+playing a frame of identical lines. Reported are the minimum line
+duration that plays without stalls, the cycles from the trigger to the
+start of the first line and to the first output change, and the stalls
+at a given duration. The line start cycles are also checked against the
+emulator (:func:`pdq.host.emulator.schedule`).
+
+Record the results with ``-o line_rate.json`` and compare later gateware
+against them with ``-b line_rate.json``. The exit status is non-zero if
+any minimum duration or latency increased or the emulator disagrees.
+"""
+
+import argparse
+import json
+import re
+import sys
+
+import numpy as np
+from migen import *
+
+from pdq.gateware.dac import Dac
+from pdq.host.protocol import Channel, disassemble
+from pdq.host.emulator import line_fifo, schedule
+
+
+class LineTB(Module):
+    """Play a channel memory image on a :class:`Dac`.
+
+    Args:
+        mem (bytes): Channel memory image.
+        fifo (int): Line FIFO depth.
+
+    Attributes:
+        starts (list[int]): Cycles at which lines were started.
+        outputs (list[int]): DAC output data of each cycle.
+    """
+    def __init__(self, mem, fifo=line_fifo):
+        self.submodules.dac = Dac(fifo=fifo)
+        words = np.frombuffer(mem + bytes(len(mem) % 4), "<u4")
+        self.dac.parser.mem.init = [int(i) for i in words]
+        self.starts = []
+        self.outputs = []
+
+    def run(self, trigger, cycles):
+        """Enable the channel and raise the trigger input at cycle
+        ``trigger``."""
+        yield self.dac.parser.start.eq(1)
+        yield self.dac.parser.arm.eq(1)
+        yield self.dac.out.arm.eq(1)
+        yield
+        for i in range(cycles):
+            if i == trigger - 1:  # high from cycle trigger on
+                yield self.dac.out.trigger.eq(1)
+            self.outputs.append((yield self.dac.out.data))
+            if (yield self.dac.out.sink.stb) and (yield self.dac.out.sink.ack):
+                self.starts.append(i)
+            yield
+
+
+def make_frame(typ, words, duration, lines=64):
+    """Serialize a frame of identical lines.
+
+    The first line waits for the trigger. The first data word (the
+    amplitude offset) is non-zero.
+
+    Returns:
+        bytes: Channel memory image.
+    """
+    ch = Channel(max_data=1 << 12, num_frames=4)
+    segment = ch.new_segment()
+    data = b"\x00\x10" + bytes(2*(words - 1))
+    for i in range(lines):
+        segment.line(typ=typ, duration=duration, data=data, trigger=i == 0)
+    segment.line(typ=3, data=b"", duration=1, jump=True)
+    return ch.serialize()
+
+
+def measure(typ, words, duration, fifo=line_fifo, lines=64, trigger=50):
+    """Simulate a frame of identical lines.
+
+    Returns:
+        dict: ``start_latency`` and ``latency`` in cycles from the trigger
+        to the start of the first line and to the first output change,
+        ``rate`` of sustained lines per cycle, number of ``stalls``
+        between lines, ``stall_cycles`` in total and whether the line
+        starts agree with the ``emulator``.
+    """
+    mem = make_frame(typ, words, duration, lines)
+    l, = disassemble(mem, [0])
+    trig = np.arange(trigger, trigger + (lines + 8)*(duration + 16))
+    start, inc = schedule(l["header"], l["duration"], trig, l["addr"], fifo)
+    tb = LineTB(mem, fifo)
+    run_simulation(tb, tb.run(trigger, int(start[-1]) + 40))
+    starts = np.array(tb.starts[:lines])
+    change = np.flatnonzero(np.array(tb.outputs[trigger:]) != 0)
+    gaps = np.diff(starts) - duration
+    return {
+        "start_latency": int(starts[0] - trigger),
+        "latency": int(change[0]) if len(change) else None,
+        "rate": (len(starts) - 1)/float(starts[-1] - starts[0]),
+        "stalls": int(np.count_nonzero(gaps)),
+        "stall_cycles": int(gaps.sum()),
+        "emulator": tb.starts[:len(start)] == start.tolist(),
+    }
+
+
+def min_duration(typ, words, fifo=line_fifo, lines=64, max_duration=None):
+    """Find the minimum line duration that plays without stalls.
+
+    The FIFO is filled while the first line waits for the trigger. Stalls
+    of lines slightly shorter than sustainable only show once it has
+    drained. ``lines`` needs to be large compared to the FIFO depth times
+    the cycles to read a line.
+
+    Args:
+        max_duration (int): Largest duration to try. Defaults to the line
+            length in words.
+
+    Returns:
+        int: Minimum duration. ``None`` if it exceeds ``max_duration``.
+    """
+    if max_duration is None:
+        max_duration = words + 2
+    lo, hi = 0, max_duration  # stalls at lo, none at hi
+    if measure(typ, words, hi, fifo, lines)["stalls"]:
+        return None
+    while hi - lo > 1:
+        mid = (lo + hi)//2
+        if measure(typ, words, mid, fifo, lines)["stalls"]:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def line_types():
+    """Line types to benchmark.
+
+    Returns:
+        list[tuple]: ``(name, typ, words)``. Bias lines with 1 to 9 data
+        words, DDS lines with 1 to 14 data words.
+    """
+    return ([("bias[words={}]".format(w), 0, w) for w in range(1, 10)] +
+            [("dds[words={}]".format(w), 1, w) for w in range(1, 15)])
+
+
+def compare(results, baseline):
+    """Compare results against a baseline.
+
+    Returns:
+        list[tuple]: ``(name, key, baseline, result)`` for each increased
+        minimum duration or latency and each emulator disagreement.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if not result["emulator"]:
+            regressions.append((name, "emulator", True, False))
+        if name not in baseline:
+            continue
+        for key in "min_duration", "start_latency", "latency":
+            old, new = baseline[name][key], result[key]
+            if old is not None and (new is None or new > old):
+                regressions.append((name, key, old, new))
+    return regressions
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="write results to JSON file")
+    parser.add_argument("-b", "--baseline", help="compare to JSON file")
+    parser.add_argument("-f", "--fifo", default=line_fifo, type=int,
+                        help="line FIFO depth [%(default)s]")
+    parser.add_argument("-n", "--lines", default=None, type=int,
+                        help="lines per frame [16 + 8*(fifo + 2)]")
+    parser.add_argument("-d", "--duration", default=4, type=int,
+                        help="line duration to report stalls at "
+                        "[%(default)s]")
+    parser.add_argument("-k", "--select", default="",
+                        help="only run line types matching this regex")
+    return parser
+
+
+def main():
+    args = get_argparser().parse_args()
+    if args.lines is None:
+        args.lines = 16 + 8*(args.fifo + 2)
+    results = {}
+    print("{:16s} {:>8s} {:>8s} {:>8s} {:>8s} {:>8s}".format(
+        "line", "min dur", "start", "latency", "stalls", "cycles"))
+    for name, typ, words in line_types():
+        if not re.search(args.select, name):
+            continue
+        r = measure(typ, words, args.duration, args.fifo, args.lines)
+        r["min_duration"] = min_duration(typ, words, args.fifo, args.lines)
+        r["duration"] = args.duration
+        results[name] = r
+        print("{:16s} {:>8} {:8d} {:>8} {:8d} {:8d}{}".format(
+            name, r["min_duration"], r["start_latency"], r["latency"],
+            r["stalls"], r["stall_cycles"],
+            "" if r["emulator"] else "  emulator mismatch"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"fifo": args.fifo, "lines": args.lines,
+                       "results": results}, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline)
+        for name, key, old, new in regressions:
+            print("regression: {} {} {} -> {}".format(name, key, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+import asyncio
+import copy
+import unittest
+
+from pdq.host.aio import AsyncPDQ
+from pdq.host.profile import Profile
+from pdq.host.protocol import ProgramCache
+from pdq.host.usb import PDQ
+from pdq.test.test_usb import WriteLog, arm, program
+
+
+class AsyncLog(WriteLog):
+    async def write_exactly(self, data):
+        await asyncio.sleep(0)
+        self.write(data)
+
+
+class TestAsync(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    async def arm(self, dev, program):
+        await dev.set_config(enable=False)
+        await dev.program(copy.deepcopy(program))
+        await dev.set_frame(0)
+        await dev.set_config(enable=True)
+
+    def test_program(self):
+        ref = PDQ(dev=WriteLog())
+        arm(ref)
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop)
+        self.loop.run_until_complete(self.arm(dev, program))
+        # one write per register access and one per memory
+        self.assertEqual(len(dev.dev.writes), 3 + dev.num_dacs)
+        self.assertEqual(dev.dev.getvalue(), ref.dev.getvalue())
+        self.assertEqual(dev.checksum, ref.checksum)
+        self.assertEqual(dev.shadow, ref.shadow)
+
+    def test_profile(self):
+        ref = PDQ(dev=WriteLog())
+        ref.profile = Profile()
+        arm(ref)
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop)
+        dev.profile = Profile()
+        self.loop.run_until_complete(self.arm(dev, program))
+        r, r_ref = dev.profile.as_dict(), ref.profile.as_dict()
+        self.assertEqual(r["counters"], r_ref["counters"])
+        for stage in "encode", "place", "serialize", "escape", "crc":
+            self.assertEqual(r["spans"][stage]["count"],
+                             r_ref["spans"][stage]["count"], stage)
+        for channel, ch in r_ref["channels"].items():
+            for name in "image_bytes", "mem_bytes":
+                self.assertEqual(r["channels"][channel][name], ch[name])
+
+    def test_upload(self):
+        ref = PDQ(dev=WriteLog())
+        ref.program(copy.deepcopy(program))
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop)
+        compiled = dev.encode(copy.deepcopy(program),
+                              list(range(dev.num_channels)))
+        self.loop.run_until_complete(dev.upload(
+            list(range(dev.num_channels)), compiled))
+        self.assertEqual(dev.dev.getvalue(), ref.dev.getvalue())
+
+    def test_cache(self):
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop, cache=ProgramCache())
+        self.loop.run_until_complete(dev.program(copy.deepcopy(program)))
+        ref = dev.dev.getvalue()
+        dev.shadow.clear()
+        dev.dev = AsyncLog()
+        self.loop.run_until_complete(dev.program(copy.deepcopy(program)))
+        self.assertEqual(dev.dev.getvalue(), ref)
+
+    def test_write(self):
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop)
+        self.loop.run_until_complete(dev.write(b"\xa5"))
+        self.assertEqual(dev.dev.getvalue(), b"\xa5\x02\xa5\xa5\xa5\x03")
+
+    def test_length_prefix(self):
+        ref = PDQ(dev=WriteLog(), length_prefix=True)
+        arm(ref)
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop, length_prefix=True)
+        self.loop.run_until_complete(self.arm(dev, program))
+        self.assertEqual(dev.dev.getvalue(), ref.dev.getvalue())
+        self.assertEqual(dev.checksum, ref.checksum)
+
+    def test_stream(self):
+        ref = PDQ(dev=WriteLog())
+        ref.program_stream(copy.deepcopy(program), chunk_size=32)
+        dev = AsyncPDQ(dev=AsyncLog(), loop=self.loop)
+        self.loop.run_until_complete(dev.program_stream(
+            copy.deepcopy(program), chunk_size=32))
+        self.assertEqual(dev.dev.getvalue(), ref.dev.getvalue())
+        self.assertGreater(len(dev.dev.writes), dev.num_channels)
+        self.assertEqual(dev.shadow, ref.shadow)
@@ -0,0 +1,131 @@
+# Copyright 2016-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+from io import BytesIO
+
+from migen import *
+from migen.sim import run_simulation
+
+from pdq.gateware.comm import FTDI2SPI, Protocol
+from pdq.host.usb import PDQ
+
+
+class TB(Module):
+    def __init__(self, **kwargs):
+        self.mems = [Memory(32, 8) for i in range(3)]
+        self.specials += self.mems
+        self.submodules.f2s = FTDI2SPI(**kwargs)
+        self.submodules.proto = Protocol(self.mems)
+        self.comb += [
+            self.f2s.source.connect(self.proto.sink),
+            self.proto.board.eq(0),
+            self.proto.source.ack.eq(1),
+        ]
+        self.frames = []
+
+    def write(self, data):
+        b = self.f2s.sink
+        for d in data:
+            yield b.data.eq(d)
+            yield b.stb.eq(1)
+            yield
+            while not (yield b.ack):
+                yield
+        yield b.stb.eq(0)
+        for i in range(4):
+            yield
+
+    @passive
+    def record(self):
+        s = self.f2s.source
+        while True:
+            if (yield s.stb) and (yield s.ack):
+                self.frames.append(((yield s.data), (yield s.eop)))
+            yield
+
+    def read(self, out):
+        out.append((yield self.proto.checksum))
+        for mem in self.mems:
+            data = []
+            for i in range(mem.depth):
+                d = (yield mem[i])
+                data.extend([d & 0xffff, d >> 16])
+            out.append(data)
+
+
+def run(length_prefix):
+    dev = PDQ(dev=BytesIO(), num_boards=1, length_prefix=length_prefix)
+    dev.set_config(enable=False, board=0)
+    dev.write_mem(0, 0, bytes([0xa5, 1, 0xa5, 0xa5, 2, 3]), board=0)
+    dev.write_mem(2, 4, bytes(range(0xa0, 0xb0)), board=0)
+    dev.write_mem(1, 0, bytes([0xa5]*4), board=1)  # ignored
+    dev.write_mem(1, 2, b"\x04\xa5\x02\xa5\x03\x00", board=0)
+    dev.set_frame(3, board=0)
+    tb = TB()
+    out = []
+
+    def gen():
+        yield from tb.write(dev.dev.getvalue())
+        yield from tb.read(out)
+    run_simulation(tb, [gen(), tb.record()])
+    return tb.frames, out, dev.checksum
+
+
+def test():
+    ref_frames, ref_out, checksum = run(False)
+    frames, out, checksum2 = run(True)
+    assert frames == ref_frames, (frames, ref_frames)
+    assert out == ref_out, (out, ref_out)
+    assert out[0] == checksum == checksum2, (out[0], checksum)
+    assert out[1][:3] == [0x01a5, 0xa5a5, 0x0302], out[1]
+    assert all(f[1] == 0 for f in frames)
+
+
+def resync(truncated, length_prefix, timeout=32):
+    dev = PDQ(dev=BytesIO(), num_boards=1, length_prefix=length_prefix)
+    dev.set_frame(3, board=0)
+    tb = TB(timeout=timeout)
+    out = []
+
+    def gen():
+        yield from tb.write(truncated)
+        for i in range(timeout + 2):
+            yield
+        yield from tb.write(dev.dev.getvalue())
+        out.append((yield tb.proto.frame))
+    run_simulation(tb, [gen(), tb.record()])
+    return out[0]
+
+
+def test_resync():
+    for length_prefix in False, True:
+        dev = PDQ(dev=BytesIO(), num_boards=1, length_prefix=length_prefix)
+        dev.write_mem(0, 0, bytes(range(8)), board=0)
+        msg = dev.dev.getvalue()
+        # truncated in the header, in the data and before the last byte
+        points = [3, 8]
+        if length_prefix:
+            # an escaped frame ending on a lone escape character is ambiguous
+            points.append(len(msg) - 1)
+        for n in points:
+            for next_prefix in False, True:
+                frame = resync(msg[:n], next_prefix)
+                assert frame == 3, (length_prefix, n, next_prefix, frame)
+
+
+if __name__ == "__main__":
+    test()
+    test_resync()
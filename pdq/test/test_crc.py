@@ -1,8 +1,12 @@
 import logging
+import os
+import time
+
 from migen import *
 
 from misoc.cores.liteeth_mini.mac.crc import LiteEthMACCRCEngine
 from pdq.host.protocol import crc8
+from pdq.host.crc import CRC
 
 logger = logging.getLogger(__name__)
 
@@ -32,5 +36,33 @@ def test():
     assert out[-1] == crc8(m)
 
 
+def test_chunked():
+    for poly in 0x107, 0x11021, 0x1814141AB:
+        crc = CRC(poly)
+        for n in 0, 9, 2047, 2048, 5000, 40960:
+            m = os.urandom(n)
+            assert crc(m, 0x5a) == crc._serial(m, 0x5a)
+
+
+def test_combine():
+    m = os.urandom(10000)
+    for i in 0, 1, 3000, 10000:
+        assert crc8.combine(crc8(m[:i], 0x12), crc8(m[i:]),
+                            len(m) - i) == crc8(m, 0x12)
+    assert crc8.zeros(0x34, 1000) == crc8(bytes(1000), 0x34)
+
+
+def bench(n=40960, repeat=5):
+    m = os.urandom(n)
+    for name, f in ("serial", crc8._serial), ("chunked", crc8):
+        t = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            f(m)
+            t.append(time.perf_counter() - t0)
+        print("{:8s} {:d} bytes: {:.3f} ms".format(name, n, min(t)*1e3))
+
+
 if __name__ == "__main__":
     test()
+    bench()
@@ -21,14 +21,24 @@ import struct
 from migen import *
 
 from pdq.gateware.dac import Dac
+from pdq.host.protocol import Channel, disassemble
 from pdq.host.usb import PDQ
+from pdq.host.emulator import emulate, schedule
+
+
+def mem_init(mem):
+    """Pack 16 bit memory words into the 32 bit entries of the Parser."""
+    mem = [int(i) for i in mem]
+    if len(mem) % 2:
+        mem.append(0)
+    return [lo | hi << 16 for lo, hi in zip(mem[::2], mem[1::2])]
 
 
 class TB(Module):
     def __init__(self, mem=None):
         self.submodules.dac = Dac()
         if mem is not None:
-            self.dac.parser.mem.init = [int(i) for i in mem]
+            self.dac.parser.mem.init = mem_init(mem)
         self.outputs = []
         self.dac.parser.frame.reset = 0
 
@@ -94,6 +104,98 @@ _test_program = [
 ]
 
 
+class EmulatorTB(Module):
+    def __init__(self, mem):
+        self.submodules.dac = Dac()
+        self.dac.parser.mem.init = mem_init(mem)
+        self.outputs = []
+
+    def run(self, ncycles):
+        yield self.dac.parser.start.eq(1)
+        yield self.dac.parser.arm.eq(1)
+        yield self.dac.out.arm.eq(1)
+        yield self.dac.out.trigger.eq(1)
+        yield
+        for i in range(ncycles):
+            self.outputs.append((yield self.dac.out.data))
+            yield
+
+
+def test_emulator():
+    p = PDQ(dev=BytesIO())
+    p.program(_test_program)
+    for channel in p.channels:
+        mem = channel.serialize()
+        # the trigger is always high: the frame repeats
+        n = len(emulate(mem, frames=[0]*3))
+        out = emulate(mem, frames=[0]*4, cycles=n)
+        tb = EmulatorTB(struct.unpack("<" + "H"*(len(mem)//2), mem))
+        run_simulation(tb, tb.run(len(out)))
+        assert tb.outputs == out.tolist()
+
+
+class LineTB(Module):
+    def __init__(self, mem, fifo):
+        self.submodules.dac = Dac(fifo=fifo)
+        self.dac.parser.mem.init = mem_init(mem)
+        self.starts = []
+
+    def run(self, ncycles):
+        yield self.dac.parser.start.eq(1)
+        yield self.dac.parser.arm.eq(1)
+        yield self.dac.out.arm.eq(1)
+        yield self.dac.out.trigger.eq(1)
+        yield
+        for i in range(ncycles):
+            if (yield self.dac.out.sink.stb) and (yield self.dac.out.sink.ack):
+                self.starts.append(i)
+            yield
+
+
+def line_starts(lines, fifo):
+    """Serialize lines of ``(words, duration)`` into one frame and return the
+    line start cycles of the gateware and of the emulator."""
+    ch = Channel(max_data=1 << 10, num_frames=4)
+    segment = ch.new_segment()
+    for words, duration in lines:
+        segment.line(typ=0, duration=duration, data=bytes(2*words))
+    segment.line(typ=3, data=b"", duration=1, jump=True)
+    mem = ch.serialize()
+    l, = disassemble(mem, [0])
+    start, inc = schedule(l["header"], l["duration"], addr=l["addr"],
+                          fifo=fifo)
+    tb = LineTB(struct.unpack("<" + "H"*(len(mem)//2), mem), fifo)
+    run_simulation(tb, tb.run(int(start[-1]) + 1))
+    return tb.starts, start.tolist()
+
+
+def test_schedule():
+    # mixed line lengths, odd and even addresses
+    lines = [(w, d) for w, d in zip([3, 14, 0, 9, 1, 6, 13, 2, 4, 7],
+                                     [1, 5, 2, 9, 1, 3, 20, 1, 2, 6])]
+    for fifo in 0, 2, 4:
+        starts, ref = line_starts(lines, fifo)
+        assert starts == ref, (fifo, starts, ref)
+
+
+def test_line_rate():
+    # two words are read per cycle: lines of n words as short as
+    # ceil(n/2) cycles play back to back
+    for words in 1, 9, 14:
+        n = words + 2  # header and duration
+        for fifo in 0, 4:
+            starts, ref = line_starts([(words, (n + 1)//2)]*8, fifo)
+            assert all(b - a == (n + 1)//2 for a, b in
+                       zip(starts, starts[1:8])), (words, fifo, starts)
+    # the FIFO is filled during a long line and sustains a burst of shorter
+    # lines
+    lines = [(14, 100)] + [(14, 2)]*4
+    starts, ref = line_starts(lines, 4)
+    assert [b - a for a, b in zip(starts, starts[1:5])] == [100, 2, 2, 2]
+    starts, ref = line_starts(lines, 0)
+    assert [b - a for a, b in zip(starts, starts[1:5])] == [100, 8, 8, 8]
+
+
 def test():
     import logging
     logging.basicConfig(level=logging.DEBUG)
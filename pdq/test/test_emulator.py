@@ -0,0 +1,80 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from pdq.host.emulator import emulate, cordic, schedule
+from pdq.host.fit import quantize, evaluate
+from pdq.host.protocol import Channel, disassemble
+
+
+class TestEmulator(unittest.TestCase):
+    def setUp(self):
+        self.ch = Channel(max_data=1 << 10, num_frames=4)
+
+    def serialize(self, lines):
+        segment = self.ch.new_segment()
+        for line in lines:
+            segment.bias(**line)
+        segment.line(typ=3, data=b"", duration=1, jump=True)
+        return self.ch.serialize()
+
+    def test_bias(self):
+        a = [[.3, 1e-3, -2e-5, 3e-7], [-.2, 0, 1e-4], [1.]]
+        mem = self.serialize([
+            dict(amplitude=a[0], duration=40),
+            dict(amplitude=a[1], duration=7, shift=2),
+            dict(amplitude=a[2], duration=3)])
+        out = emulate(mem).view(np.int16)
+        lines, = disassemble(mem, [0])
+        start, inc = schedule(lines["header"], lines["duration"])
+        np.testing.assert_equal(start[1:] - start[:-1], [40, 28, 3])
+        t = start[0] + 2  # load plus output register
+        np.testing.assert_equal(out[t:t + 40],
+                                evaluate(quantize(a[0]), np.arange(40)))
+        t += 40
+        np.testing.assert_equal(out[t:t + 28],
+                                evaluate(quantize(a[1]), np.arange(28) >> 2))
+
+    def test_stall(self):
+        # lines shorter than the parser can supply stall the sequencer
+        mem = self.serialize([dict(amplitude=[0, 1e-3], duration=2)]*4)
+        lines, = disassemble(mem, [0])
+        start, inc = schedule(lines["header"], lines["duration"])
+        np.testing.assert_equal(start[1:4] - start[:3], [3, 3, 3])
+        # one additional evolution step while stalled
+        np.testing.assert_equal(inc[:2] - start[0], [1, 2])
+
+    def test_trigger(self):
+        mem = self.serialize([dict(amplitude=[1.], duration=10, trigger=True),
+                              dict(amplitude=[2.], duration=10, trigger=True)])
+        lines, = disassemble(mem, [0])
+        start, inc = schedule(lines["header"], lines["duration"],
+                              trigger=[3, 100, 200])
+        np.testing.assert_equal(start, [100, 200, 210])
+        out = emulate(mem, trigger=[3, 100, 200], cycles=300)
+        self.assertEqual(out[101], 0)
+        self.assertEqual(out[102], out[201])
+        self.assertNotEqual(out[202], out[201])
+
+    def test_cordic(self):
+        x = np.full(64, 10000)
+        z = np.arange(-1 << 15, 1 << 15, 1 << 10)
+        ref = 10000*1.6467602*np.cos(z*np.pi/(1 << 15))
+        np.testing.assert_allclose(cordic(x, z), ref, atol=3)
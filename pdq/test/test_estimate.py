@@ -0,0 +1,75 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+import copy
+from io import BytesIO
+import unittest
+
+import numpy as np
+
+from pdq.host.estimate import (program_messages, image_messages, usb_bytes,
+                               usb_time, spi_time, ft245r_cycles)
+from pdq.host.usb import PDQ
+from pdq.test.test_usb import program
+
+
+class TestEstimate(unittest.TestCase):
+    def test_usb_bytes(self):
+        dev = PDQ(dev=BytesIO())
+        messages = program_messages(copy.deepcopy(program), dev=dev)
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(usb_bytes(messages), len(dev.dev.getvalue()))
+        # delta against the programmed shadow
+        self.assertEqual(program_messages(copy.deepcopy(program), dev=dev,
+                                          delta=True), [])
+        self.assertEqual(usb_bytes(image_messages({(0, 1): b"\xa5\x00"})),
+                         4 + 3 + 3)
+        dev = PDQ(dev=BytesIO(), length_prefix=True)
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(usb_bytes(messages, length_prefix=True),
+                         len(dev.dev.getvalue()))
+
+    def test_options(self):
+        rng = np.random.RandomState(0)
+        frame = [{
+            "duration": 100 + i,
+            "channel_data": [{"bias": {"amplitude": list(
+                rng.uniform(-1, 1, 4)*[5, 1e-3, 1e-7, 1e-11])}}],
+        } for i in range(16)]
+        program = [frame, frame]
+        ref = program_messages(copy.deepcopy(program), num_boards=1)
+        dev = PDQ(dev=BytesIO(), num_boards=1)
+        dev.escape_budget = 1e-3
+        dev.dedup = True
+        messages = program_messages(copy.deepcopy(program), dev=dev)
+        self.assertLess(usb_bytes(messages), usb_bytes(ref))
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(usb_bytes(messages), len(dev.dev.getvalue()))
+
+    def test_usb_time(self):
+        messages = image_messages({(0, 0): bytes(1000)})
+        self.assertEqual(ft245r_cycles(), 18)
+        t = usb_time(messages, usb_rate=1e9)
+        self.assertAlmostEqual(t, (1000 + 7)*18/50e6)
+        self.assertAlmostEqual(usb_time(messages), (1000 + 7)/1e6)
+
+    def test_spi_time(self):
+        messages = image_messages({(0, 0): bytes(200), (1, 2): bytes(2)})
+        t = spi_time(messages, write_div=2, ref_period=1.)
+        bit = 2
+        self.assertEqual(t, (24 + 16*100 + 1)*bit + 1 +
+                         (24 + 16*1 + 1)*bit + 1)
+        self.assertGreater(spi_time(messages, event_period=1e-3), .1)
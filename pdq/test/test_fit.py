@@ -0,0 +1,83 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from pdq.host.fit import fit, quantize, evaluate
+from pdq.host.protocol import Segment
+
+
+class TestFit(unittest.TestCase):
+    def check(self, t, y, lines, tolerance):
+        start = t[0]
+        for line in lines:
+            shift = int(np.log2(line["dac_divider"]))
+            stop = start + (line["duration"] << shift)
+            i = (t >= start) & ((t < stop) | (t == stop) & (stop == t[-1]))
+            v = quantize(line["channel_data"][0]["bias"]["amplitude"])
+            out = evaluate(v, (t[i] - start) >> shift)/Segment.out_scale
+            self.assertLessEqual(np.fabs(out - y[i]).max(), tolerance)
+            start = stop
+        self.assertEqual(start, t[-1])
+
+    def test_smooth(self):
+        t = np.arange(1001)*100
+        y = (1 - np.cos(t/t[-1]*2*np.pi))/2*5
+        lines = fit(t, y, 1e-3)
+        self.check(t, y, lines, 1e-3)
+        self.assertLess(len(lines), 20)
+        self.assertLess(len(fit(t, y, 1e-3, order=1)), 200)
+
+    def test_shift(self):
+        t = np.arange(101)*(1 << 12)
+        y = np.linspace(-1, 1, len(t))
+        lines = fit(t, y, 1e-3, order=1)
+        self.check(t, y, lines, 1e-3)
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]["dac_divider"], 1 << 3)
+
+    def test_steps(self):
+        t = np.arange(50)*10
+        y = np.sign(np.sin(t/100.))
+        lines = fit(t, y, 1e-3)
+        self.check(t, y, lines, 1e-3)
+        self.assertEqual(len(fit(t, y, 1e-3, order=0)), 3)
+
+    def test_long_gap(self):
+        t = np.array([0, 65537, 131074])
+        y = np.array([0., 1., 0.])
+        lines = fit(t, y, 1e-3)
+        self.check(t, y, lines, 1e-3)
+
+    def test_tolerance(self):
+        t = np.arange(5)
+        y = np.array([0., 1e-5, 3e-5, -1e-5, 0.])
+        with self.assertWarns(UserWarning):
+            lines = fit(t, y, 1e-7, order=0)
+        self.check(t, y, lines, .5/Segment.out_scale)
+        with self.assertRaises(ValueError):
+            fit(t, y*1e6, 1e-3)
+
+    def test_evaluate(self):
+        a = [.5, 1e-3, -3e-6, 1e-8]
+        n = np.arange(1000)
+        v = quantize(a)
+        out = evaluate(v, n)/Segment.out_scale
+        ref = a[0] + a[1]*n + a[2]*n**2/2 + a[3]*n**3/6
+        self.assertLess(np.fabs(out - ref).max(), 1e-3)
@@ -0,0 +1,70 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+from migen import *
+from migen.genlib.record import Record
+from migen.sim import run_simulation
+
+from pdq.gateware.ft245r import Ft245r_rx
+from pdq.host.estimate import ft245r_cycles
+
+
+pads_layout = [
+    ("rxfl", 1),
+    ("rdl", 1),
+    ("g1_in", 1),
+    ("g1_out", 1),
+    ("data", 8),
+]
+
+
+class TB(Module):
+    def __init__(self):
+        self.pads = Record(pads_layout)
+        self.submodules.dut = Ft245r_rx(self.pads)
+        # single board: read strobe loops back directly
+        self.comb += self.pads.g1_in.eq(self.pads.g1_out)
+
+
+def _test_ft245r(tb, data, out):
+    # FT245R with a full FIFO
+    pads = tb.pads
+    yield tb.dut.source.ack.eq(1)
+    rdl = 1
+    for i in range(30*len(data) + 20):
+        yield pads.rxfl.eq(not data)
+        if data:
+            yield pads.data.eq(data[0])
+        yield
+        rdl, rdl_prev = (yield pads.rdl), rdl
+        if rdl and not rdl_prev:
+            data.pop(0)
+        if (yield tb.dut.source.stb):
+            out.append(((yield tb.dut.source.data), i))
+
+
+def test():
+    data = list(range(1, 33))
+    tb = TB()
+    out = []
+    run_simulation(tb, _test_ft245r(tb, list(data), out))
+    assert [d for d, t in out] == data, out
+    period = set(b[1] - a[1] for a, b in zip(out, out[1:]))
+    assert period == {ft245r_cycles()}, period
+
+
+if __name__ == "__main__":
+    test()
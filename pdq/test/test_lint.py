@@ -0,0 +1,102 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+
+from pdq.host.emulator import schedule
+from pdq.host.fit import quantize, evaluate
+from pdq.host.lint import lint_lines, lint_channel, lint_frame, repair
+from pdq.host.protocol import Channel, Segment, disassemble
+from pdq.test.test_program import MemoryPDQ
+
+
+def bias_frame(durations, t0=0):
+    frame = []
+    for i, duration in enumerate(durations):
+        t = t0 + sum(durations[:i])
+        frame.append({
+            "duration": duration,
+            "channel_data": [{"bias": {"amplitude": [
+                .1 + 1e-3*t + 1e-6*t**2, 1e-3 + 2e-6*t, 2e-6]}}],
+        })
+    frame[0]["trigger"] = True
+    return frame
+
+
+def output(frame):
+    y = []
+    for line in frame:
+        v = quantize(line["channel_data"][0]["bias"]["amplitude"])
+        n = np.arange(line["duration"]*line.get("dac_divider", 1))
+        n >>= int(np.log2(line.get("dac_divider", 1)))
+        y.append(evaluate(v, n)/Segment.out_scale)
+    return np.concatenate(y)
+
+
+class TestLint(unittest.TestCase):
+    def test_schedule(self):
+        rng = np.random.RandomState(0)
+        ch = Channel(max_data=1 << 10, num_frames=4)
+        segment = ch.new_segment()
+        for i in range(64):
+            words = rng.randint(0, 15)
+            segment.line(typ=0, data=bytes(2*words),
+                         duration=rng.randint(1, 10), shift=rng.randint(2))
+        segment.line(typ=3, data=b"", duration=1, jump=True)
+        l, = disassemble(ch.serialize(), [0])
+        start, inc = schedule(l["header"], l["duration"], addr=l["addr"],
+                              fifo=0)
+        cycles = l["duration"].astype(np.int64) << l["shift"]
+        late = lint_lines(l["header"], l["duration"], l["addr"])
+        self.assertTrue(late.any())
+        self.assertEqual(late[0], 0)
+        np.testing.assert_equal(late[1:], np.diff(start) - cycles[:-1])
+        # odd addresses are the worst case
+        self.assertTrue(np.all(lint_lines(l["header"], l["duration"]) >=
+                               late))
+
+    def test_channel(self):
+        dev = MemoryPDQ(num_boards=1, num_frames=4)
+        dev.program([bias_frame([100, 100]), bias_frame([100, 2, 2, 100])])
+        ch = dev.channels[0]
+        r = lint_channel(ch)
+        self.assertEqual([(frame, late) for frame, addr, late in r],
+                         [(1, 2), (1, 2)])
+
+    def test_frame(self):
+        frame = bias_frame([100, 3, 2, 5, 100])
+        np.testing.assert_equal(lint_frame(frame), [0, 0, 2, 3, 0, 0])
+        frame[-1]["duration"] = 1
+        self.assertEqual(lint_frame(frame)[-1], 1)
+
+    def test_repair(self):
+        frame = bias_frame([20] + [2]*16 + [20])
+        self.assertTrue(lint_frame(frame).any())
+        fixed = repair(frame, tolerance=1e-3)
+        self.assertLess(len(fixed), len(frame))
+        self.assertFalse(lint_frame(fixed).any())
+        self.assertTrue(fixed[0]["trigger"])
+        self.assertEqual(sum(line["duration"]*line.get("dac_divider", 1)
+                             for line in fixed), 20 + 2*16 + 20)
+        self.assertLess(np.fabs(output(fixed) - output(frame)).max(), 1e-3)
+
+    def test_repair_tolerance(self):
+        frame = bias_frame([20, 2, 20])
+        frame[1]["channel_data"][0]["bias"]["amplitude"][0] += .1
+        self.assertEqual(repair(frame, tolerance=1e-3), frame)
@@ -0,0 +1,111 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+
+try:
+    from pdq.artiq.mediator import CompoundPDQ, ProgramError
+except ImportError:
+    CompoundPDQ = None
+
+
+class Core:
+    def seconds_to_mu(self, seconds):
+        return int(round(seconds*1e9))
+
+
+class FakePDQ:
+    """PDQ stack that records the programs and configurations."""
+    def __init__(self, log, index, num_channels, error=None, barrier=None):
+        self.log = log
+        self.index = index
+        self.num_channels = num_channels
+        self.error = error
+        self.barrier = barrier
+
+    def get_num_channels(self):
+        return self.num_channels
+
+    def program(self, program):
+        self.log.append(("program", self.index, program))
+        if self.barrier is not None:
+            # all devices need to be programming at the same time
+            self.barrier.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+
+    def set_config(self, enable, **kwargs):
+        self.log.append(("config", self.index, enable))
+
+
+@unittest.skipUnless(CompoundPDQ, "no artiq found")
+class TestCompoundPDQ(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+
+    def compound(self, pdqs, **kwargs):
+        devices = {"core": Core(), "ttl": None}
+        devices.update(("pdq{}".format(i), pdq) for i, pdq in enumerate(pdqs))
+        dev = CompoundPDQ(devices, ["pdq{}".format(i)
+                                    for i in range(len(pdqs))],
+                          "ttl", **kwargs)
+        frame = dev.create_frame()
+        segment = frame.create_segment()
+        segment.add_line(100, [{"bias": {"amplitude": [i]}}
+                               for i in range(sum(pdq.num_channels
+                                                  for pdq in pdqs))])
+        return dev
+
+    def test_concurrent(self):
+        barrier = threading.Barrier(3)
+        pdqs = [FakePDQ(self.log, i, n, barrier=barrier)
+                for i, n in enumerate([3, 2, 1])]
+        dev = self.compound(pdqs)
+        dev.arm()
+        self.assertTrue(dev.armed)
+        programs = {i: p for kind, i, p in self.log if kind == "program"}
+        channels = [[line["channel_data"] for line in programs[i][0]]
+                    for i in range(3)]
+        self.assertEqual(channels, [
+            [[{"bias": {"amplitude": [i]}} for i in range(0, 3)]],
+            [[{"bias": {"amplitude": [i]}} for i in range(3, 5)]],
+            [[{"bias": {"amplitude": [5]}}]]])
+
+    def test_order(self):
+        pdqs = [FakePDQ(self.log, i, 3) for i in range(3)]
+        dev = self.compound(pdqs, max_workers=1)
+        dev.arm()
+        self.assertEqual([kind for kind, i, p in self.log],
+                         ["program"]*3 + ["config"]*3)
+        self.assertEqual(self.log[3:], [("config", i, 1) for i in range(3)])
+
+    def test_errors(self):
+        barrier = threading.Barrier(3)
+        errors = [ValueError("a"), None, MemoryError("c")]
+        pdqs = [FakePDQ(self.log, i, 3, errors[i], barrier)
+                for i in range(3)]
+        dev = self.compound(pdqs)
+        with self.assertRaises(ProgramError) as cm:
+            dev.arm()
+        self.assertEqual(cm.exception.errors,
+                         {0: errors[0], 2: errors[2]})
+        self.assertIs(cm.exception.__cause__, errors[0])
+        self.assertFalse(dev.armed)
+        # all devices were programmed and none was enabled
+        self.assertEqual(sorted(i for kind, i, p in self.log), [0, 1, 2])
+        self.assertNotIn("config", [kind for kind, i, p in self.log])
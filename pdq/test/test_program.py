@@ -0,0 +1,378 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import copy
+import io
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from pdq.host.protocol import PDQBase, ProgramCache
+from pdq.host.report import report, format_report
+from pdq.host import cli
+from pdq.host.usb import PDQ
+
+
+class MemoryPDQ(PDQBase):
+    """PDQ stack that records memory writes into local memories."""
+    def __init__(self, **kwargs):
+        PDQBase.__init__(self, **kwargs)
+        self.mems = [[bytearray(2*ch.max_data) for j in range(self.num_dacs)]
+                     for ch in self.channels[::self.num_dacs]]
+        self.writes = []
+        self.compiled = 0
+
+    def program_segments(self, segments, data):
+        self.compiled += 1
+        PDQBase.program_segments(self, segments, data)
+
+    def write_mem(self, mem, adr, data, board=0xf):
+        self.writes.append((board, mem, adr, len(data)))
+        if board == 0xf:
+            boards = range(self.num_boards)
+        else:
+            boards = [board]
+        for i in boards:
+            self.mems[i][mem][adr:adr + len(data)] = data
+
+    def check(self, tc, channels=None):
+        if channels is None:
+            channels = range(self.num_channels)
+        for i in channels:
+            board, mem = divmod(i, self.num_dacs)
+            ch = self.channels[i]
+            m = self.mems[board][mem]
+            tc.assertEqual(bytes(m[:2*ch.num_frames]), ch.table())
+            for segment in ch.segments:
+                a = 2*segment.addr
+                tc.assertEqual(m[a:a + len(segment.data)], segment.data)
+
+
+def ramp(amplitudes, duration=100):
+    return [{
+        "trigger": True,
+        "duration": duration,
+        "channel_data": [{"bias": {"amplitude": [a, 1e-4]}}
+                         for a in amplitudes],
+    }]
+
+
+class TestProgram(unittest.TestCase):
+    def setUp(self):
+        self.dev = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8)
+
+    def test_delta(self):
+        program = [ramp([.1*i + j for i in range(6)]) for j in range(8)]
+        self.dev.program(copy.deepcopy(program))
+        full = sum(n for board, mem, adr, n in self.dev.writes)
+        self.dev.check(self)
+        self.dev.writes.clear()
+        self.dev.program(copy.deepcopy(program), delta=True)
+        self.assertEqual(self.dev.writes, [])
+        program[3] = ramp([.2*i + 3.05 for i in range(6)])
+        self.dev.program(copy.deepcopy(program), delta=True)
+        self.dev.check(self)
+        delta = sum(n for board, mem, adr, n in self.dev.writes)
+        self.assertEqual(len(self.dev.writes), 6)
+        self.assertLess(delta, full/20)
+
+    def test_grow(self):
+        self.dev.program([ramp(range(6))])
+        program = [ramp(range(6)), ramp([-.1*i for i in range(6)], 200)]
+        self.dev.program(program, delta=True)
+        self.dev.check(self)
+        self.dev.writes.clear()
+        self.dev.program([ramp(range(6))], delta=False)
+        self.dev.check(self)
+        self.assertEqual(len(self.dev.writes), 6)
+
+    def test_broadcast(self):
+        program = [ramp([.1*j]*6) for j in range(8)]
+        self.dev.program(copy.deepcopy(program))
+        self.dev.check(self)
+        self.assertEqual([w[:2] for w in self.dev.writes],
+                         [(0xf, 0), (0xf, 1), (0xf, 2)])
+        self.dev.writes.clear()
+        program[2] = ramp([.1*2]*4 + [.75, .1*2])
+        self.dev.program(copy.deepcopy(program), delta=True)
+        self.dev.check(self)
+        self.assertEqual([w[:2] for w in self.dev.writes], [(1, 1)])
+        self.dev.writes.clear()
+        self.dev.program(copy.deepcopy(program), delta=False)
+        self.dev.check(self)
+        self.assertEqual([w[:2] for w in self.dev.writes],
+                         [(0xf, 0), (0, 1), (1, 1), (0xf, 2)])
+
+    def test_stream(self):
+        program = [ramp([.1*i + j for i in range(6)]) for j in range(8)]
+        ref = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8)
+        ref.program(copy.deepcopy(program))
+        self.dev.program(program[:2])
+        self.dev.writes.clear()
+        self.dev.program_stream(copy.deepcopy(program), chunk_size=16)
+        self.dev.check(self)
+        self.assertEqual(self.dev.mems, ref.mems)
+        self.assertTrue(all(n <= 16 for board, mem, adr, n in
+                            self.dev.writes))
+        self.assertEqual(self.dev.shadow, ref.shadow)
+        for (board, mem), image in self.dev.shadow.items():
+            ch = self.dev.channels[board*self.dev.num_dacs + mem]
+            self.assertTrue(all(segment.view.obj is image
+                                for segment in ch.segments))
+        self.dev.writes.clear()
+        self.dev.program(copy.deepcopy(program), delta=True)
+        self.assertEqual(self.dev.writes, [])
+
+    def test_stream_far(self):
+        # more than 64 KiB: write addresses are 16 bit
+        program = [[{"duration": 100 + i, "channel_data": [
+            {"bias": {"amplitude": [.1, 1e-4, 1e-8, 1e-12]}}]}
+            for i in range(3200)]]
+        ref = MemoryPDQ(num_boards=1, num_dacs=1)
+        ref.program(copy.deepcopy(program))
+        dev = MemoryPDQ(num_boards=1, num_dacs=1)
+        dev.program_stream(copy.deepcopy(program), chunk_size=1 << 12)
+        self.assertEqual(dev.mems, ref.mems)
+        self.assertEqual(dev.shadow, ref.shadow)
+        self.assertGreater(len(dev.shadow[(0, 0)]), 1 << 16)
+        self.assertTrue(all(adr <= 0xffff for board, mem, adr, n in
+                            dev.writes))
+        self.assertGreater(len(dev.writes), 1)
+        dev = PDQ(dev=io.BytesIO(), num_boards=1, num_dacs=1)
+        dev.program_stream(copy.deepcopy(program), chunk_size=1 << 12)
+        self.assertEqual(dev.shadow, ref.shadow)
+
+    def test_parallel(self):
+        program = [ramp([.1*i + j for i in range(6)]) for j in range(8)]
+        dev = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8, processes=2)
+        self.addCleanup(dev.close)
+        dev.min_parallel = 0
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(dev.compiled, 0)
+        dev.check(self)
+        self.dev.program(copy.deepcopy(program))
+        self.assertEqual(dev.mems, self.dev.mems)
+        pool = dev._pool
+        program[3] = ramp([.2*i for i in range(6)])
+        dev.program(copy.deepcopy(program))
+        self.assertIs(dev._pool, pool)
+        dev.check(self)
+        dev.min_parallel = 1 << 20
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(dev.compiled, 8)
+        dev.close()
+        self.assertIsNone(dev._pool)
+
+    def test_escape_budget(self):
+        rng = np.random.RandomState(0)
+        program = [[{
+            "duration": 100 + j,
+            "channel_data": [{"bias": {"amplitude": list(
+                rng.uniform(-1, 1, 4)*[5, 1e-3, 1e-7, 1e-11])}}
+                for i in range(6)],
+        } for j in range(16)]]
+        ref = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8)
+        ref.program(copy.deepcopy(program))
+        self.dev.escape_budget = 1e-3
+        self.dev.program(copy.deepcopy(program))
+        self.dev.check(self)
+        escapes = [sum(m.count(0xa5) for board in dev.mems for m in board)
+                   for dev in (ref, self.dev)]
+        self.assertLess(escapes[1], escapes[0])
+        for ch in self.dev.channels:
+            errors = ch.segments[0].dither_errors
+            self.assertEqual(len(errors), 16)
+            self.assertTrue(all(0 <= e <= 1e-3 for e in errors))
+        dev = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8, processes=2)
+        self.addCleanup(dev.close)
+        dev.min_parallel = 0
+        dev.escape_budget = 1e-3
+        dev.program(copy.deepcopy(program))
+        self.assertEqual(dev.mems, self.dev.mems)
+        errors = [ch.segments[0].dither_errors for ch in self.dev.channels]
+        self.assertEqual([ch.segments[0].dither_errors
+                          for ch in dev.channels], errors)
+        dev = MemoryPDQ(num_boards=2, num_dacs=3, num_frames=8,
+                        cache=ProgramCache())
+        dev.escape_budget = 1e-3
+        for i in range(2):
+            dev.program(copy.deepcopy(program))
+            self.assertEqual([ch.segments[0].dither_errors
+                              for ch in dev.channels], errors)
+
+    def test_diff(self):
+        old = bytes(20)
+        new = bytearray(old)
+        new[2] = new[6] = new[18] = 1
+        self.assertEqual(self.dev.diff_mem(old, new), [(2, 8), (18, 20)])
+        self.assertEqual(self.dev.diff_mem(old, new + b"\x00\x01"),
+                         [(2, 8), (18, 22)])
+        self.assertEqual(self.dev.diff_mem(old, old), [])
+
+    def test_diff_far(self):
+        # write addresses are 16 bit
+        old = bytes(0x12000)
+        new = bytearray(old)
+        new[0x10010] = new[0x11000] = 1
+        self.assertEqual(self.dev.diff_mem(old, new), [(0xfffe, 0x11002)])
+        new[0x100] = 1
+        self.assertEqual(self.dev.diff_mem(old, new), [(0x100, 0x11002)])
+        dev = PDQ(dev=io.BytesIO(), num_boards=1)
+        dev.shadow[(0, 0)] = bytearray(old)
+        dev.update_mem(0, new, 0)
+        self.assertEqual(dev.shadow[(0, 0)], new)
+        self.assertEqual(len(dev.dev.getvalue()), 0x11002 - 0x100 + 7)
+
+
+class TestProgramFrame(unittest.TestCase):
+    def setUp(self):
+        self.dev = MemoryPDQ(num_boards=1, num_dacs=1, num_frames=4)
+        self.dev.channels[0].max_data = 34
+
+    def frame(self, n, v=1.):
+        return [{"duration": 10 + i,
+                 "channel_data": [{"bias": {"amplitude": [v, 1e-4]}}]}
+                for i in range(n)]
+
+    def test_replace(self):
+        ch = self.dev.channels[0]
+        self.dev.program([self.frame(1), self.frame(2), self.frame(1, .5)])
+        addr = [f.addr for f in ch.frames[:3]]
+        self.dev.writes.clear()
+        self.dev.program_frame(0, self.frame(1, .2))
+        self.dev.check(self)
+        self.assertEqual(ch.frames[0].addr, addr[0])
+        self.assertEqual(self.dev.writes, [(0, 0, 2*addr[0] + 4, 2)])
+        self.dev.writes.clear()
+        self.dev.program_frame(1, self.frame(1, .2))
+        self.dev.check(self)
+        self.assertEqual(ch.frames[1].addr, addr[0])
+        self.assertEqual(self.dev.writes, [(0, 0, 2, 2)])
+        self.dev.program_frame(3, self.frame(2, .3))
+        self.dev.check(self)
+        self.assertEqual(ch.frames[3].addr, addr[1])
+        self.assertEqual(ch.free(), [(30, 4)])
+
+    def test_no_shadow(self):
+        ch = self.dev.channels[0]
+        for program in self.dev.program, self.dev.program_stream:
+            program([self.frame(1), self.frame(2), self.frame(1, .5)])
+            # power cycle
+            self.dev.mems[0][0][:] = bytes(len(self.dev.mems[0][0]))
+            self.dev.shadow.clear()
+            self.dev.program_frame(1, self.frame(1, .2))
+            self.dev.check(self)
+            self.assertEqual(bytes(self.dev.mems[0][0][:8]), ch.table())
+            self.assertTrue(np.frombuffer(ch.table(), "<u2")[:3].all())
+
+    def test_compact(self):
+        ch = self.dev.channels[0]
+        self.dev.program([self.frame(1), self.frame(1, .1),
+                          self.frame(1, .2)])
+        self.dev.program_frame(1, [])
+        self.assertEqual(ch.free(), [(13, 5), (25, 9)])
+        self.dev.program_frame(3, self.frame(2))
+        self.dev.check(self)
+        self.assertEqual([f.addr for f in ch.frames], [4, 11, 13, 20])
+        frames = list(ch.frames)
+        with self.assertRaises(MemoryError):
+            self.dev.program_frame(1, self.frame(2, .7))
+        self.assertEqual(ch.frames, frames)
+        self.assertEqual([f.addr for f in ch.frames], [4, 11, 13, 20])
+        self.dev.check(self)
+
+
+class TestCache(unittest.TestCase):
+    def programs(self):
+        return [[ramp([.1*i + j for i in range(3)])] for j in range(3)]
+
+    def test_lru(self):
+        dev = MemoryPDQ(num_boards=1, num_frames=4, cache=ProgramCache(2))
+        p = self.programs()
+        for i in 0, 1, 0, 2, 0:
+            dev.program(p[i])
+            dev.check(self)
+        self.assertEqual(dev.compiled, 3)
+        dev.program(p[1])
+        self.assertEqual(dev.compiled, 4)
+        dev.program_frame(0, ramp([.5]*3))
+        dev.check(self)
+
+    def test_key(self):
+        p = self.programs()[0]
+        key = ProgramCache.key(p, num_dacs=3)
+        self.assertEqual(key, ProgramCache.key(copy.deepcopy(p), num_dacs=3))
+        self.assertNotEqual(key, ProgramCache.key(p, num_dacs=2))
+
+    def test_disk(self):
+        p = self.programs()
+        with tempfile.TemporaryDirectory() as path:
+            dev = MemoryPDQ(num_boards=1, num_frames=4,
+                            cache=ProgramCache(path=path))
+            dev.program(p[0])
+            dev.cache.clear()
+            mem = copy.deepcopy(dev.mems)
+            dev = MemoryPDQ(num_boards=1, num_frames=4,
+                            cache=ProgramCache(path=path))
+            dev.program(p[0])
+            self.assertEqual(dev.compiled, 0)
+            self.assertEqual(dev.mems, mem)
+
+
+class TestReport(unittest.TestCase):
+    def test_report(self):
+        dev = MemoryPDQ(num_boards=1, num_frames=4)
+        dev.dedup = True
+        dev.program([ramp([.1, .2, .3]), [], ramp([.1, .2, .4])])
+        r = report(dev)
+        self.assertEqual([ch["channel"] for ch in r], [0, 1, 2])
+        ch = r[2]
+        self.assertEqual([f["frame"] for f in ch["frames"]], [0, 1, 2])
+        self.assertEqual(ch["frames"][1]["lines"], 1)
+        f = ch["frames"][2]
+        self.assertEqual((f["lines"], f["words"], f["cycles"]),
+                         (2, 7, 101))
+        self.assertAlmostEqual(f["seconds"], 101/dev.freq)
+        self.assertEqual(ch["used"], 4 + 2 + 7 + 7)
+        self.assertEqual(ch["free"], ch["max_data"] - ch["used"])
+        self.assertEqual(ch["largest_free"], ch["free"])
+        # identical frames are shared
+        self.assertEqual(r[0]["used"], 4 + 2 + 7)
+        self.assertIn("frame  2", format_report(r))
+
+    def test_cli(self):
+        out = io.StringIO()
+        dev = io.BytesIO()
+        with contextlib.redirect_stdout(out):
+            cli.main(dev, args=["-R", "-D", "-l", "1e-3", "-f", "2", "-c", "1",
+                                "-t", "np.arange(11)*1e-6"])
+        self.assertEqual(dev.getvalue(), b"")
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("channel 1:"))
+        self.assertIn("frame  2:", lines[3])
+        self.assertIn("501 cycles", lines[3])
+        # encoded once for the report and the upload
+        with mock.patch.object(PDQBase, "encode", autospec=True,
+                               side_effect=PDQBase.encode) as encode:
+            with contextlib.redirect_stdout(io.StringIO()):
+                cli.main(dev, args=["-R", "-l", "1e-3", "-f", "2", "-c", "1",
+                                    "-t", "np.arange(11)*1e-6"])
+        self.assertEqual(encode.call_count, 1)
+        self.assertNotEqual(dev.getvalue(), b"")
@@ -24,7 +24,7 @@ from pdq.gateware.comm import Protocol
 
 class TB(Module):
     def __init__(self):
-        self.mems = [Memory(16, 4, init=[i]) for i in range(3)]
+        self.mems = [Memory(32, 2, init=[i]) for i in range(3)]
         self.specials += self.mems
         self.submodules.proto = Protocol(self.mems)
         self.comb += self.proto.board.eq(0b0101)
@@ -62,19 +62,19 @@ class TB(Module):
         yield from self.seq([
             (1 << 7) | (0b0101 << 3) | (1 << 2) | (0 << 0),
             0x00, 0x10, 0x01, 0x00])
-        r = (yield self.mems[0][0])
+        r = (yield from self.word(0, 0))
         assert r == 0x0001, hex(r)
         print("mem write XXX")
         yield from self.seq([
             (1 << 7) | (0b0101 << 3) | (1 << 2) | (0 << 0),
             0x02, 0x20, 0x02, 0x00])
-        r = (yield self.mems[0][1])
+        r = (yield from self.word(0, 1))
         assert r == 0x0002, hex(r)
         print("mem write XXX")
         yield from self.seq([
             (1 << 7) | (0b0101 << 3) | (1 << 2) | (2 << 0),
             0x04, 0x30, 0x0f, 0x10])
-        r = (yield self.mems[2][2])
+        r = (yield from self.word(2, 2))
         assert r == 0x100f, hex(r)
         print("mem write done")
 
@@ -88,7 +88,9 @@ class TB(Module):
         yield from self.seq([
             (1 << 7) | (0b0101 << 3) | (1 << 2) | (0 << 0),
             0x02, 0x00, 0x01, 0x10, 0x02, 0x20, 0x03, 0x30])
-        r = yield from [(yield self.mems[0][i]) for i in range(1, 4)]
+        r = []
+        for i in range(1, 4):
+            r.append((yield from self.word(0, i)))
         assert r == [0x1001, 0x2002, 0x3003], r
 
         # test multi read
@@ -97,6 +99,10 @@ class TB(Module):
             0x02, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])
         assert r == [0x01, 0x10, 0x02, 0x20, 0x03, 0x30], r
 
+    def word(self, mem, adr):
+        # 16 bit word from the 32 bit memory entries
+        return ((yield self.mems[mem][adr//2]) >> 16*(adr % 2)) & 0xffff
+
     def seq(self, seq):
         yield self.proto.sink.eop.eq(0)
         yield
@@ -0,0 +1,249 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import unittest
+
+import numpy as np
+
+from pdq.host.protocol import Segment, Channel, disassemble
+from pdq.host.fit import evaluate
+
+
+class TestSegmentArray(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def test_bias(self):
+        n = 200
+        duration = self.rng.randint(1, 1 << 16, n)
+        shift = self.rng.randint(0, 4, n)
+        trigger = self.rng.randint(0, 2, n).astype(bool)
+        for order in range(5):
+            amplitude = self.rng.uniform(-1, 1, (n, order))*[
+                5, 1e-3, 1e-7, 1e-11][:order]
+            s_ref = Segment()
+            for i in range(n):
+                s_ref.bias(amplitude=list(amplitude[i]),
+                           duration=int(duration[i]), shift=int(shift[i]),
+                           trigger=bool(trigger[i]), aux=True)
+            s = Segment()
+            s.bias_array(duration, amplitude, shift=shift, trigger=trigger,
+                         aux=True)
+            self.assertEqual(bytes(s.data), bytes(s_ref.data))
+
+    def test_dds(self):
+        n = 100
+        duration = self.rng.randint(1, 1 << 16, n)
+        amplitude = self.rng.uniform(-1, 1, (n, 4))*[5, 1e-3, 1e-7, 1e-11]
+        for order in range(4):
+            phase = self.rng.uniform(-.5, .5, (n, order))*[
+                1, 1e-2, 1e-6][:order]
+            s_ref = Segment()
+            for i in range(n):
+                s_ref.dds(amplitude=list(amplitude[i]),
+                          phase=list(phase[i]), duration=int(duration[i]),
+                          clear=i % 3 == 0)
+            s = Segment()
+            s.dds_array(duration, amplitude, phase,
+                        clear=np.arange(n) % 3 == 0)
+            self.assertEqual(bytes(s.data), bytes(s_ref.data))
+
+    def test_range(self):
+        s = Segment()
+        with self.assertRaises(ValueError):
+            s.bias_array([10], [[20.]])
+        with self.assertRaises(ValueError):
+            s.bias_array([1 << 16], [[1.]])
+
+    def test_buffer(self):
+        s = Segment()
+        ref = b""
+        for i in range(1000):
+            data = bytes([i & 0xff, i >> 8])*(i % 15)
+            s.line(typ=0, duration=i, data=data)
+            ref += bytes([(1 + i % 15) & 0xff, 0, i & 0xff, i >> 8]) + data
+        self.assertEqual(s.data, ref)
+        self.assertIsInstance(s.data, bytes)
+        self.assertEqual(s.view, ref)
+
+    def test_data(self):
+        s = Segment()
+        s.line(typ=0, duration=1, data=b"")
+        s.data += b"\x01\x00\x02\x00"
+        self.assertEqual(s.data, b"\x01\x00\x01\x00\x01\x00\x02\x00")
+        s.line(typ=0, duration=3, data=b"")
+        self.assertEqual(s.data[8:], b"\x01\x00\x03\x00")
+        s.data = b""
+        self.assertEqual(len(s.view), 0)
+
+
+class TestDither(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        n = 500
+        self.duration = self.rng.randint(1, 1000, n)
+        self.amplitude = self.rng.uniform(-1, 1, (n, 4))*[
+            5, 1e-3, 1e-7, 1e-11]
+
+    def bias(self, budget):
+        s = Segment()
+        s.escape_budget = budget
+        for a, d in zip(self.amplitude, self.duration):
+            s.bias(amplitude=list(a), duration=int(d))
+        return s
+
+    def accumulators(self, data):
+        # c0, c1, c2, c3 in units of 2**-32 output steps, see fit.quantize()
+        fields = [(4, 6, 32), (6, 10, 16), (10, 16, 0), (16, 22, 0)]
+        return [int.from_bytes(data[a:b], "little", signed=True) << c
+                for a, b, c in fields]
+
+    def test_zero_budget(self):
+        s = self.bias(0.)
+        self.assertEqual(s.dither_errors, [0.]*len(self.duration))
+        s.escape_budget = None
+        ref = self.bias(None)
+        self.assertEqual(bytes(s.data), bytes(ref.data))
+
+    def test_bias(self):
+        budget = 1.
+        s = self.bias(budget)
+        ref = self.bias(None)
+        self.assertEqual(len(s.dither_errors), len(self.duration))
+        self.assertTrue(all(0 <= e <= budget for e in s.dither_errors))
+        self.assertGreater(bytes(ref.data).count(0xa5),
+                           bytes(s.data).count(0xa5))
+        for i, (d, e) in enumerate(zip(self.duration, s.dither_errors)):
+            line = slice(22*i, 22*(i + 1))
+            data, data_ref = bytes(s.data[line]), bytes(ref.data[line])
+            self.assertNotIn(0xa5, data[4:])
+            n = np.arange(d + 1)
+            out = evaluate(self.accumulators(data), n)
+            out_ref = evaluate(self.accumulators(data_ref), n)
+            self.assertLessEqual(np.abs(out - out_ref).max(),
+                                 e*Segment.out_scale + 1)
+            if e == 0:
+                self.assertEqual(data, data_ref)
+
+    def test_array(self):
+        for budget in 0., 1e-3, 1.:
+            s = self.bias(budget)
+            s_array = Segment()
+            s_array.escape_budget = budget
+            s_array.bias_array(self.duration, self.amplitude)
+            self.assertEqual(bytes(s_array.data), bytes(s.data))
+            np.testing.assert_equal(s_array.dither_errors, s.dither_errors)
+            s = Segment()
+            s.escape_budget = budget
+            for a, d in zip(self.amplitude, self.duration):
+                s.dds(amplitude=list(a), phase=[.1, 1e-3, 1e-7],
+                      duration=int(d))
+            s_array = Segment()
+            s_array.escape_budget = budget
+            s_array.dds_array(self.duration, self.amplitude,
+                              [[.1, 1e-3, 1e-7]]*len(self.duration))
+            self.assertEqual(bytes(s_array.data), bytes(s.data))
+            np.testing.assert_equal(s_array.dither_errors, s.dither_errors)
+
+
+class TestChannel(unittest.TestCase):
+    def setUp(self):
+        self.ch = Channel(max_data=1 << 10, num_frames=4)
+
+    def add_frame(self, amplitude, jump=True):
+        segment = self.ch.new_segment()
+        segment.bias(amplitude=amplitude, duration=10)
+        segment.line(typ=3, data=b"", duration=1, jump=jump)
+        return segment
+
+    def test_dedup(self):
+        s = [self.add_frame([i % 2]) for i in range(4)]
+        data = self.ch.serialize(dedup=True)
+        self.assertEqual(len(data), 2*(4 + 2*(3 + 2)))
+        self.assertEqual(s[0].addr, s[2].addr)
+        self.assertEqual(s[1].addr, s[3].addr)
+        self.assertNotEqual(s[0].addr, s[1].addr)
+        self.assertEqual(len(self.ch.serialize()),
+                         2*(4 + 4*(3 + 2)))
+
+    def test_table(self):
+        s = [self.add_frame([0])]
+        self.ch.serialize()
+        s.append(self.add_frame([1]))
+        self.ch.serialize()
+        self.assertEqual(self.ch.table(), struct.pack("<HHHH", 4, 9, 0, 0))
+        self.assertEqual(self.ch.frames, s + [None, None])
+
+    def test_fallthrough(self):
+        s = [self.add_frame([0], jump=False), self.add_frame([0]),
+             self.add_frame([0])]
+        self.ch.place(dedup=True)
+        self.assertEqual(s[1].addr, s[0].addr + 5)
+        self.assertEqual(s[2].addr, s[1].addr)
+
+    def test_iter_serialize(self):
+        for i in range(4):
+            self.add_frame([i % 2], jump=i != 1)
+        data = self.ch.serialize(dedup=True)
+        for chunk_size in 2, 6, 18, 1 << 12:
+            chunks = list(self.ch.iter_serialize(chunk_size, dedup=True))
+            self.assertEqual(b"".join(chunks), data)
+            self.assertTrue(all(len(c) == chunk_size for c in chunks[:-1]))
+
+
+class TestDisassemble(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+        self.ch = Channel(max_data=1 << 12, num_frames=4)
+
+    def test_roundtrip(self):
+        n = 50
+        duration = self.rng.randint(1, 1 << 16, n)
+        shift = self.rng.randint(0, 4, n)
+        amplitude = self.rng.uniform(-1, 1, (n, 4))*[5, 1e-3, 1e-7, 1e-11]
+        phase = self.rng.uniform(-.5, .5, (n, 3))*[1, 1e-2, 1e-6]
+        s0 = self.ch.new_segment()
+        s0.bias_array(duration, amplitude, shift=shift, aux=True)
+        s0.line(typ=3, data=b"", duration=1, jump=True, trigger=True)
+        s1 = self.ch.new_segment()
+        s1.dds_array(duration, amplitude, phase, clear=True,
+                     jump=np.arange(n) == n - 1)
+        data = self.ch.serialize()
+        lines = disassemble(data, range(self.ch.num_frames))
+        self.assertEqual([len(l) for l in lines], [n + 1, n, 0, 0])
+        l = lines[0]
+        self.assertEqual(l[0]["addr"], s0.addr)
+        np.testing.assert_equal(l["typ"], [0]*n + [3])
+        np.testing.assert_equal(l["duration"][:n], duration)
+        np.testing.assert_equal(l["shift"][:n], shift)
+        np.testing.assert_equal(l["aux"][:n], 1)
+        np.testing.assert_equal(l["end"], [0]*n + [1])
+        np.testing.assert_allclose(l["amplitude"][:n], amplitude,
+                                   rtol=1e-4, atol=1/Segment.out_scale)
+        self.assertEqual(l["raw"][0, 0], int(round(
+            amplitude[0, 0]*Segment.out_scale)))
+        l = lines[1]
+        np.testing.assert_equal(l["clear"], 1)
+        np.testing.assert_equal(l["end"], [0]*(n - 1) + [1])
+        np.testing.assert_allclose(l["phase"], phase, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(l["amplitude"], amplitude, rtol=1e-4,
+                                   atol=Segment.cordic_gain/Segment.out_scale)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            disassemble(bytes([4, 0, 0x10, 0]), [0])
@@ -211,9 +211,10 @@ class TB(Module):
         adr = 2
         data = [0x12, 0x93, 0x99]
         yield from self.write_mem(mem, adr, data)
-        data_mem = (yield from [
-            (yield self.p.dut.dac1.parser.mem[i])
-            for i in range(0, 4)])
+        data_mem = []
+        for i in range(0, 2):
+            d = (yield self.p.dut.dac1.parser.mem[i])
+            data_mem.extend([d & 0xffff, d >> 16])
         assert data_mem == [0, 0x9312, 0x0099, 0], data_mem
         datar = (yield from self.read_mem(mem, adr, len(data)))
         assert data == datar, (data, datar)
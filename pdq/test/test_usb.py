@@ -0,0 +1,116 @@
+# Copyright 2013-2017 Robert Jordens <jordens@gmail.com>
+#
+# This file is part of pdq.
+#
+# pdq is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pdq is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pdq.  If not, see <http://www.gnu.org/licenses/>.
+
+from io import BytesIO
+import unittest
+
+from pdq.host.profile import Profile
+from pdq.host.usb import PDQ
+
+
+class WriteLog(BytesIO):
+    def __init__(self):
+        BytesIO.__init__(self)
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(len(data))
+        return BytesIO.write(self, data)
+
+
+program = [[{
+    "trigger": True,
+    "duration": 100,
+    "channel_data": [{"bias": {"amplitude": [.1*i, 1e-4]}}
+                     for i in range(9)],
+}]]
+
+
+def arm(dev):
+    dev.set_config(enable=False)
+    dev.program(program)
+    dev.set_frame(0)
+    dev.set_config(enable=True)
+
+
+class TestBatch(unittest.TestCase):
+    def test_batch(self):
+        ref = PDQ(dev=WriteLog())
+        arm(ref)
+        dev = PDQ(dev=WriteLog())
+        with dev.batch():
+            arm(dev)
+            self.assertEqual(dev.dev.writes, [])
+        self.assertEqual(dev.dev.writes, [len(ref.dev.getvalue())])
+        self.assertEqual(dev.dev.getvalue(), ref.dev.getvalue())
+        self.assertEqual(dev.checksum, ref.checksum)
+
+    def test_program(self):
+        dev = PDQ(dev=WriteLog())
+        dev.program(program)
+        self.assertEqual(len(dev.dev.writes), 1)
+
+    def test_high_water(self):
+        ref = PDQ(dev=WriteLog())
+        arm(ref)
+        dev = PDQ(dev=WriteLog(), high_water=64)
+        with dev.batch():
+            arm(dev)
+            dev.flush()
+            n = len(dev.dev.writes)
+            dev.set_frame(1)
+        self.assertGreater(n, 2)
+        self.assertEqual(len(dev.dev.writes), n + 1)
+        self.assertEqual(dev.dev.getvalue()[:len(ref.dev.getvalue())],
+                         ref.dev.getvalue())
+
+
+class TestProfile(unittest.TestCase):
+    def test_program(self):
+        dev = PDQ(dev=WriteLog())
+        dev.profile = Profile()
+        arm(dev)
+        r = dev.profile.as_dict()
+        for stage in "encode", "place", "serialize", "update", "escape", \
+                "crc", "device":
+            self.assertGreater(r["spans"][stage]["count"], 0, stage)
+        self.assertEqual(r["spans"]["place"]["count"], dev.num_channels)
+        self.assertEqual(r["counters"]["wire_bytes"],
+                         len(dev.dev.getvalue()))
+        self.assertEqual(sorted(r["channels"]), list(range(9)))
+        for ch in r["channels"].values():
+            self.assertGreater(ch["encode"], 0)
+        self.assertEqual(r["spans"]["encode"]["count"],
+                         len(program)*dev.num_channels)
+        self.assertEqual(sum(ch["image_bytes"]
+                             for ch in r["channels"].values()),
+                         r["counters"]["image_bytes"])
+        dev.profile.clear()
+        self.assertEqual(dev.profile.as_dict()["spans"], {})
+
+
+class TestLengthPrefix(unittest.TestCase):
+    def test_write(self):
+        dev = PDQ(dev=BytesIO(), length_prefix=True)
+        dev.write(b"\xa5\x01")
+        self.assertEqual(dev.dev.getvalue(), b"\xa5\x04\x02\x00\xa5\x01")
+        ref = PDQ(dev=BytesIO())
+        ref.write(b"\xa5\x01")
+        self.assertEqual(dev.checksum, ref.checksum)
+        dev.dev = BytesIO()
+        dev.write(bytes(1 << 16))
+        self.assertEqual(dev.dev.getvalue()[:2], b"\xa5\x02")